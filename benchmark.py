@@ -0,0 +1,174 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+import merge_raw_data
+import synthetic_timetable
+from metro_graph import load_snapshot
+from graph_builder import build_graph, source_graph
+from stage_cache import StageCache
+from coverage_search import a_star, path_summary, SearchOptions
+
+RESULTS_FILE = "working/benchmark.json"
+BASELINE_FILE = "working/benchmark_baseline.json"
+REPEATS = 3 # fresh processes per scenario; the fastest run counts
+SEARCH_COVERAGE = 30 # stations the search has to cover, unless the scenario sets "coverage"
+SEARCH_EXPANSIONS = 200000 # give up on a scenario's search after this many pops
+TOLERANCE = 0.2 # slowdown against the baseline reported as a regression
+NOISE_FLOOR = 0.05 # seconds; smaller differences are never regressions
+
+# every scenario merges data/ (or a synthetic_timetable network of the given scale) into a fresh
+# directory and builds with an empty cache
+SCENARIOS = {
+    "test_data": {"days": "12345", "test_data": True},
+    "suppressed": {"days": "12345", "suppress": True, "coverage": 20}, # only ~22 key stations left
+    "weekday": {"days": "12345"},
+    "weekend": {"days": "67"},
+    "synthetic_x1": {"days": "12345", "synthetic": 1},
+    "synthetic_x10": {"days": "12345", "synthetic": 10},
+    "synthetic_x25": {"days": "12345", "synthetic": 25}, # 150 lines: over 256 line directions
+}
+TIMINGS = ["merge", "build", "load", "search"]
+
+
+def run_scenario(name, data_dir="data"):
+    """Time the stages of scenario ``name`` in this process; meant to run in a fresh one."""
+    scenario = SCENARIOS[name]
+    days = scenario["days"]
+    with tempfile.TemporaryDirectory() as directory:
+        result = {}
+        if scenario.get("synthetic"):
+            data_dir = os.path.join(directory, "data")
+            start = time.perf_counter()
+            synthetic_timetable.generate(data_dir, scenario["synthetic"], days=days)
+            result["generate"] = time.perf_counter() - start
+            shutil.copyfile(os.path.join(data_dir, "transfer_time.json"), os.path.join(directory, "transfer_time.json"))
+        else:
+            shutil.copyfile(os.path.join("working", "transfer_time.json"), os.path.join(directory, "transfer_time.json"))
+
+        start = time.perf_counter()
+        schedules = merge_raw_data.load_schedules(days, data_dir)
+        merge_raw_data.save_schedules(schedules, os.path.join(directory, f"{days}.npz"))
+        result["merge"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        built = build_graph(days, suppress=scenario.get("suppress", False), test_data=scenario.get("test_data", False),
+                            data_dir=directory, cache=StageCache(os.path.join(directory, "cache")))
+        result["build"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        graph = load_snapshot(built.snapshot)
+        result["load"] = time.perf_counter() - start
+
+        G, source, stations_index = source_graph(built._replace(graph=graph))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            path = a_star(G, source, stations_index, segments=built.segments,
+                          options=SearchOptions(max_expansions=SEARCH_EXPANSIONS,
+                                                target_coverage=scenario.get("coverage", SEARCH_COVERAGE)))
+        result["search"] = time.perf_counter() - start
+
+        coverage, _ = path_summary(G, path, stations_index)
+        result.update({
+            "nodes": graph.number_of_nodes(),
+            "edges": graph.number_of_edges(),
+            "coverage": coverage,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        })
+    return result
+
+
+def measure(name, repeats=REPEATS):
+    """Run a scenario ``repeats`` times, each in a new process so peak RSS is its own."""
+    runs = []
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeats):
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(run_scenario, (name,)))
+    result = dict(runs[0])
+    for timing in TIMINGS + ["generate"]:
+        if timing in result:
+            result[timing] = round(min(run[timing] for run in runs), 4)
+    result["peak_rss_mb"] = round(max(run["peak_rss_mb"] for run in runs), 1)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline):
+    """
+    Print every metric next to the baseline.
+
+    Returns:
+        list: ``(scenario, metric, baseline, current)`` of the regressions:
+        timings more than ``TOLERANCE`` (and ``NOISE_FLOOR`` seconds) slower,
+        a larger peak RSS by the same share, or a search that covered less
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            print(f"{name}: not in the baseline")
+            continue
+        for metric in TIMINGS + ["peak_rss_mb", "coverage"]:
+            old, new = previous[metric], result[metric]
+            if metric == "coverage":
+                worse = new < old
+            else:
+                worse = new > old * (1 + TOLERANCE) and (metric == "peak_rss_mb" or new - old > NOISE_FLOOR)
+            ratio = new / old if old else float("inf")
+            print(f"{name:12s} {metric:12s} {old:10.3f} -> {new:10.3f} ({ratio:5.2f}x){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark merge, graph build, snapshot load and search")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"any of {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--save-baseline", action="store_true", help=f"also save the results as {BASELINE_FILE}")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {sorted(unknown)}")
+
+    results = {"environment": environment(), "repeats": args.repeats,
+               "search": {"coverage": SEARCH_COVERAGE, "max_expansions": SEARCH_EXPANSIONS}, "scenarios": {}}
+    for name in args.scenarios:
+        result = results["scenarios"][name] = measure(name, args.repeats)
+        print(f"{name:12s} " + " ".join(f"{timing} {result[timing]:.3f}s" for timing in TIMINGS) +
+              f" | {result['nodes']} nodes, coverage {result['coverage']}, {result['peak_rss_mb']:.0f} MB")
+    with open(RESULTS_FILE, "w") as f:
+        json.dump(results, f, indent=4)
+    if args.save_baseline:
+        shutil.copyfile(RESULTS_FILE, BASELINE_FILE)
+        print(f"Saved the baseline {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        print(f"{len(regressions)} regressions against {BASELINE_FILE} ({baseline['environment']['commit']})")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
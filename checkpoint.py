@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+CHECKPOINT_INTERVAL = 300 # seconds between checkpoints of a running search
+
+
+def pack_masks(masks, width):
+    """Pack visited masks (Python ints) into a ``len(masks)`` x ``width`` uint8 array."""
+    packed = b"".join(mask.to_bytes(width, "little") for mask in masks)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(len(masks), width)
+
+
+def unpack_masks(packed):
+    return [int.from_bytes(row, "little") for row in map(bytes, packed)]
+
+
+class Checkpointer:
+    """
+    Write search checkpoints to ``filename`` every ``interval`` seconds on a background thread.
+
+    The search hands over its state as a dict of arrays. Building it
+    copies the whole frontier and arena on the search thread, which pauses
+    the search for a time proportional to their size; only compressing and
+    writing happen on the background thread. A checkpoint is written to a
+    temporary name and renamed over the previous one, so the file on disk
+    is always a complete checkpoint. While a write is in progress only the
+    newest pending state is kept.
+
+    A failed write (a full disk, a permission error, ...) stops the writer;
+    the error is kept in ``error`` and raised by the next ``save`` or by
+    ``close``.
+
+    Args:
+        filename (str): checkpoint file, ``.npz``
+        key (str): identity of the search (graph and options); ``load_checkpoint``
+            refuses checkpoints of another search
+        interval (float): seconds between checkpoints
+    """
+
+    def __init__(self, filename, key, interval=CHECKPOINT_INTERVAL):
+        self.filename = filename
+        self.key = key
+        self.interval = interval
+        self.last = time.monotonic()
+        self.written = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def due(self):
+        return time.monotonic() - self.last >= self.interval
+
+    def save(self, state):
+        """Queue ``state`` for writing, replacing a state still waiting for the writer."""
+        if self.error is not None:
+            raise self.error
+        self.last = time.monotonic()
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.queue.put(state)
+
+    def close(self):
+        """Finish the pending write, stop the thread and raise the error of a failed write."""
+        # a writer that died on an error never empties the queue again
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while True:
+            state = self.queue.get()
+            if state is None:
+                break
+            temp = f"{self.filename}.tmp"
+            try:
+                with open(temp, "wb") as f:
+                    np.savez_compressed(f, key=np.array(self.key), **state)
+                os.replace(temp, self.filename)
+            except Exception as e:
+                self.error = e
+                break
+            self.written += 1
+
+
+def load_checkpoint(filename, key):
+    """
+    Load the state saved by a ``Checkpointer``.
+
+    Returns:
+        dict: the saved arrays, or None if there is no checkpoint
+
+    Raises:
+        ValueError: the checkpoint belongs to a search with another key
+    """
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        if str(data["key"]) != key:
+            raise ValueError(f"{filename} is a checkpoint of another search ({data['key']}, expected {key})")
+        return {name: data[name] for name in data.files if name != "key"}
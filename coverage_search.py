@@ -0,0 +1,647 @@
+import heapq
+import random
+from collections import namedtuple
+import numpy as np
+from metro_graph import MetroGraph
+from checkpoint import pack_masks, unpack_masks
+
+STOP_TIME = 2
+CHECKPOINT_EVERY = 1024 # pops between checks whether a checkpoint is due
+FRONTIER_TRIM = 0.75 # share of max_frontier kept when the frontier is trimmed
+STATE_BYTES = 600 # approximate memory of one frontier state with its label and arena record
+ANYTIME_STEP = 0.5 # weight decrease after every improved solution of the anytime search
+
+STATION_MULTIPLIER = 1
+PATH_MULTIPLIER = 0.5
+TIME_MULTIPLIER = 0.25
+START_TIME_MULTIPLIER = 0.000001
+
+INFINITY = float("inf")
+
+
+def build_stations_index(raw_data, transfer_time):
+    """
+    Give every station its bit in the visited mask.
+
+    Stations linked by a transfer (e.g. R10 and BL12) share one index, so
+    visiting either counts as visiting both.
+    """
+    stations_index = {}
+    current_index = 0
+    for line in raw_data:
+        for station in raw_data[line]["stations"]:
+            if station in stations_index: continue
+            if line in transfer_time and station in transfer_time[line]:
+                dest_ids = set()
+                for dest_station in transfer_time[line][station]:
+                    dest_id = dest_station.split("_")[2]
+                    if dest_id not in dest_ids:
+                        dest_ids.add(dest_id)
+
+                for dest_id in dest_ids:
+                    if dest_id in stations_index:
+                        stations_index[station] = stations_index[dest_id]
+                        break
+            if station not in stations_index:
+                stations_index[station] = current_index
+                current_index += 1
+    return stations_index
+
+
+def path_summary(G: MetroGraph, path, stations_index):
+    """Return ``(stations visited, minutes from first departure to last arrival)`` of a path."""
+    visited = 0
+    for node in path:
+        station = G.node_station(node)
+        if station in stations_index:
+            visited |= 1 << stations_index[station]
+    stops = [node for node in path if node != G.source]
+    minutes = G.node_time(stops[-1]) - G.node_time(stops[0]) if stops else 0
+    return visited.bit_count(), minutes
+
+
+def station_bits(G: MetroGraph, stations_index):
+    """Return the visited-mask bit of every station of ``G`` (0 for stations outside the index)."""
+    return [1 << stations_index[station] if station in stations_index else 0 for station in G.stations]
+
+
+def arena_path(arena_node, arena_parent, entry):
+    """Follow parent pointers from ``entry`` back to the root and return the node path."""
+    path = []
+    while entry != -1:
+        path.append(arena_node[entry])
+        entry = arena_parent[entry]
+    path.reverse()
+    return path
+
+
+def front_dominates(front, start, finish):
+    """Return whether a ``(start, finish, entry)`` point of ``front`` starts no earlier and finishes no later."""
+    return any(other_start >= start and other_finish <= finish for other_start, other_finish, _ in front)
+
+
+def arena_contains(arena_node, arena_parent, node_time, entry, node):
+    """Return whether ``node`` is on the arena path ending at ``entry``."""
+    # times never decrease along a path, so a repeated node can only sit
+    # among the trailing entries that share its time
+    time = node_time[node]
+    while entry != -1 and node_time[arena_node[entry]] == time:
+        if arena_node[entry] == node:
+            return True
+        entry = arena_parent[entry]
+    return False
+
+
+class ParetoLabels:
+    """
+    Per-node Pareto sets of ``(visited mask, elapsed time)`` search labels.
+
+    A label is dominated when another label at the same node has visited a
+    superset of its stations in no more time; dominated labels are rejected
+    on insert, and labels superseded by a newer one are marked dead so the
+    search skips them when they surface from the heap.
+
+    Labels of a node are bucketed by popcount and keyed by mask, so an equal
+    mask is an O(1) lookup and only buckets that can hold a superset (or a
+    subset) of the new mask are scanned.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.dead = set()
+        self.kept = 0
+        self.pruned = 0
+        self.superseded = 0
+
+    def insert(self, node, visited, time, entry):
+        """Record label ``entry`` at ``node``; return False if it is dominated."""
+        buckets = self.labels.get(node)
+        if buckets is None:
+            buckets = self.labels[node] = {}
+        coverage = visited.bit_count()
+
+        for count, bucket in buckets.items():
+            if count < coverage: continue
+            if count == coverage:
+                label = bucket.get(visited)
+                if label is not None and label[0] <= time:
+                    self.pruned += 1
+                    return False
+                continue
+            for other_visited, (other_time, _) in bucket.items():
+                if other_time <= time and other_visited | visited == other_visited:
+                    self.pruned += 1
+                    return False
+
+        for count, bucket in buckets.items():
+            if count > coverage: continue
+            if count == coverage:
+                label = bucket.get(visited)
+                if label is not None:
+                    self.dead.add(label[1])
+                    self.superseded += 1
+                continue
+            dominated = [other_visited for other_visited, (other_time, _) in bucket.items()
+                         if time <= other_time and other_visited | visited == visited]
+            for other_visited in dominated:
+                self.dead.add(bucket.pop(other_visited)[1])
+                self.superseded += 1
+
+        buckets.setdefault(coverage, {})[visited] = (time, entry)
+        self.kept += 1
+        return True
+
+    def is_dead(self, entry):
+        """Return whether ``entry`` was superseded; each entry is popped once, so forget it."""
+        if entry in self.dead:
+            self.dead.remove(entry)
+            return True
+        return False
+
+    def report(self):
+        return f"kept {self.kept}, pruned {self.pruned}, superseded {self.superseded}"
+
+    def state(self, width):
+        """Return the labels as arrays for a checkpoint; masks are packed ``width`` bytes wide."""
+        nodes, masks, times, entries = [], [], [], []
+        for node, buckets in self.labels.items():
+            for bucket in buckets.values():
+                for visited, (time, entry) in bucket.items():
+                    nodes.append(node)
+                    masks.append(visited)
+                    times.append(time)
+                    entries.append(entry)
+        return {
+            "label_node": np.array(nodes, dtype=np.int64),
+            "label_mask": pack_masks(masks, width),
+            "label_time": np.array(times, dtype=np.float64),
+            "label_entry": np.array(entries, dtype=np.int64),
+            "label_dead": np.array(sorted(self.dead), dtype=np.int64),
+            "label_counts": np.array([self.kept, self.pruned, self.superseded], dtype=np.int64)
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        labels = cls()
+        for node, visited, time, entry in zip(state["label_node"].tolist(), unpack_masks(state["label_mask"]),
+                                              state["label_time"].tolist(), state["label_entry"].tolist()):
+            labels.labels.setdefault(node, {}).setdefault(visited.bit_count(), {})[visited] = (time, entry)
+        labels.dead = set(state["label_dead"].tolist())
+        labels.kept, labels.pruned, labels.superseded = state["label_counts"].tolist()
+        return labels
+
+
+def trim_frontier(q, labels, arena_node, arena_parent, pinned=(), limit=None, beam_width=None):
+    """
+    Drop the worst states of the heap ``q`` to bound the memory of the search.
+
+    Keeps the best ``beam_width`` states of every coverage level and/or the
+    ``limit`` best states overall. The labels are rebuilt from the kept
+    states only and the arena is compacted to their paths (and to the
+    ``pinned`` entries), so memory follows the frontier rather than every
+    state ever pushed; the search gives up completeness for it.
+
+    Returns:
+        tuple: ``(q, labels, arena_node, arena_parent, entries)``; ``entries``
+        maps the old arena entries still in use to the new ones
+    """
+    kept = sorted(item for item in q if item[1] not in labels.dead)
+    if beam_width:
+        levels = {}
+        for item in kept:
+            level = levels.setdefault(item[3].bit_count(), [])
+            if len(level) < beam_width:
+                level.append(item)
+        kept = sorted(item for level in levels.values() for item in level)
+    if limit is not None:
+        kept = kept[:limit]
+
+    used = set()
+    for entry in [item[1] for item in kept] + list(pinned):
+        while entry != -1 and entry not in used:
+            used.add(entry)
+            entry = arena_parent[entry]
+    # parents are always older than their children, so sorting keeps them first
+    order = sorted(used)
+    entries = {old: new for new, old in enumerate(order)}
+    new_node = [arena_node[old] for old in order]
+    new_parent = [entries.get(arena_parent[old], -1) for old in order]
+
+    new_labels = ParetoLabels()
+    trimmed = []
+    for item in kept:
+        entry = entries[item[1]]
+        if new_labels.insert(new_node[entry], item[3], item[2], entry):
+            trimmed.append((item[0], entry) + item[2:])
+    new_labels.kept, new_labels.pruned, new_labels.superseded = labels.kept, labels.pruned, labels.superseded
+    heapq.heapify(trimmed)
+    return trimmed, new_labels, new_node, new_parent, entries
+
+
+def frontier_limit(states=None, nbytes=None):
+    """Return the ``max_frontier`` of a limit in states and/or bytes (the tighter one), or None."""
+    limits = [limit for limit in (states, nbytes // STATE_BYTES if nbytes else None) if limit]
+    return min(limits) if limits else None
+
+
+def search_state(q, arena_node, arena_parent, labels, front, width, expansions, current_best, best_entry, finished,
+                 weight=1.0, upper_bound=None):
+    """
+    Return the state of ``a_star`` as arrays, for a ``checkpoint.Checkpointer``.
+
+    Copies the frontier, arena and labels, on the search thread; the cost
+    grows with the frontier, so checkpoints are spaced by their interval.
+    """
+    state = labels.state(width)
+    state.update({
+        "arena_node": np.array(arena_node, dtype=np.int64),
+        "arena_parent": np.array(arena_parent, dtype=np.int64),
+        "q_score": np.array([item[0] for item in q], dtype=np.float64),
+        "q_entry": np.array([item[1] for item in q], dtype=np.int64),
+        "q_time": np.array([item[2] for item in q], dtype=np.float64),
+        "q_visited": pack_masks([item[3] for item in q], width),
+        "q_traversed": np.array([item[4] for item in q], dtype=np.int64),
+        "q_depth": np.array([item[5] for item in q], dtype=np.int64),
+        "front": np.array(front, dtype=np.float64).reshape(-1, 3),
+        "counters": np.array([expansions, current_best, best_entry, finished], dtype=np.int64),
+        "bounds": np.array([weight, INFINITY if upper_bound is None else upper_bound], dtype=np.float64)
+    })
+    return state
+
+
+def restore_search(state):
+    """
+    Inverse of ``search_state``.
+
+    Returns:
+        tuple: ``(q, arena_node, arena_parent, labels, front, expansions,
+        current_best, best_entry, finished, weight, upper_bound)``
+    """
+    # the heap list is saved in heap order, so it is still a valid heap
+    q = list(zip(state["q_score"].tolist(), state["q_entry"].tolist(), state["q_time"].tolist(),
+                 unpack_masks(state["q_visited"]), state["q_traversed"].tolist(), state["q_depth"].tolist()))
+    front = [(round(start), round(finish), int(entry)) for start, finish, entry in state["front"].tolist()]
+    expansions, current_best, best_entry, finished = state["counters"].tolist()
+    weight, upper_bound = state["bounds"].tolist()
+    return (q, state["arena_node"].tolist(), state["arena_parent"].tolist(), ParetoLabels.from_state(state),
+            front, expansions, current_best, best_entry, bool(finished),
+            weight, None if upper_bound == INFINITY else upper_bound)
+
+
+def trim_search(q, labels, arena_node, arena_parent, best_entry, front, max_frontier=None, beam_width=None):
+    """
+    Trim the frontier of ``a_star`` with ``trim_frontier``, keeping the best path and the profile front.
+
+    Returns:
+        tuple: ``(q, labels, arena_node, arena_parent, best_entry, front)``
+        with the arena entries renumbered
+    """
+    q, labels, arena_node, arena_parent, entries = trim_frontier(
+        q, labels, arena_node, arena_parent, pinned=[best_entry] + [point[2] for point in front],
+        limit=int(max_frontier * FRONTIER_TRIM) if max_frontier is not None else None, beam_width=beam_width)
+    front = [(start, finish, entries[entry]) for start, finish, entry in front]
+    return q, labels, arena_node, arena_parent, entries[best_entry], front
+
+
+def reweight_frontier(q, weight, new_weight, upper_bound):
+    """Re-order the heap of a ``weight`` search for ``new_weight``, dropping states beyond ``upper_bound`` minutes."""
+    rescored = []
+    for item in q:
+        estimate = (item[0] - item[2]) / weight
+        if item[2] + estimate <= upper_bound:
+            rescored.append((item[2] + new_weight * estimate,) + item[1:])
+    heapq.heapify(rescored)
+    return rescored
+
+
+# optional modes of ``a_star`` (see its docstring); the defaults search up to the first complete path
+SearchOptions = namedtuple("SearchOptions", [
+    "progress", "output_best_path", "progress_every", "upper_bound", "max_expansions", "target_coverage",
+    "profile", "anytime", "weight", "max_frontier", "beam_width", "checkpoint", "resume", "metrics"],
+    defaults=[None, True, None, None, None, None, False, False, 1.0, None, None, None, None, None])
+
+
+class CoverageSearch:
+    """
+    The frontier, path arena and labels of one ``a_star`` search.
+
+    ``run`` pops states and passes them to the expansion step, ``expand``,
+    shared by every mode. What happens at a complete path depends on the
+    driver picked for the options: ``finish_first`` stops,
+    ``finish_anytime`` tightens the bound and goes on and
+    ``finish_profile`` adds the path to the front. Metrics, checkpoints,
+    frontier trims and the expansion limit are handled in ``maintain``,
+    which only runs when one of them is on.
+    """
+
+    def __init__(self, G: MetroGraph, source, stations_index, every_stop=False, segments=None, heuristic=None,
+                 options=SearchOptions()):
+        if options.anytime and (heuristic is None or options.profile):
+            raise ValueError("anytime search needs a heuristic and cannot profile")
+        self.G = G
+        self.source = source
+        self.from_super_source = source == G.source
+        self.every_stop = every_stop
+        self.options = options
+        self.station_num = max(stations_index.values()) + 1
+        self.goal = (1 << self.station_num) - 1
+        self.width = (self.station_num + 7) // 8
+        self.bits = station_bits(G, stations_index)
+        self.node_station, self.node_time = G.node_lists()
+        self.station_of = [stations_index.get(station) for station in G.stations]
+        station_ids = {station: i for i, station in enumerate(G.stations)}
+        self.skipped = {(station_ids[a], station_ids[b]): count for (a, b), (count, _) in (segments or {}).items()
+                        if a in station_ids and b in station_ids}
+
+        # hot calls, wrapped by the phase timers when they are on
+        self.timed = timed = options.metrics.timed if options.metrics is not None else lambda phase, function: function
+        self.heappop, self.heappush = timed("pop", heapq.heappop), timed("push", heapq.heappush)
+        self.out_edges = timed("edges", G.out_edges)
+        self.heuristic = timed("heuristic", heuristic) if heuristic is not None else None
+        self.publish = timed("publish", options.progress.publish) if options.progress is not None else None
+        self.snapshot, self.trim = timed("checkpoint", search_state), timed("trim", trim_search)
+        self.trims = 0
+
+        if options.resume is None:
+            visited = self.bits[self.node_station[source]]
+            self.arena_node, self.arena_parent = [source], [-1]
+            self.q = [(0, 0, 0, visited, 0, 1)]
+            self.labels = ParetoLabels()
+            self.labels.insert(source, visited, 0, 0)
+            self.front = []
+            self.expansions, self.current_best, self.best_entry, self.finished = 0, 0, 0, False
+            self.weight, self.upper_bound = options.weight, options.upper_bound
+        else:
+            (self.q, self.arena_node, self.arena_parent, self.labels, self.front, self.expansions, self.current_best,
+             self.best_entry, self.finished, self.weight, self.upper_bound) = restore_search(options.resume)
+            print(f"Resumed after {self.expansions} expansions: coverage {self.current_best}, frontier {len(self.q)}")
+            if self.finished and not options.profile:
+                self.q = []
+        self.insert = timed("labels", self.labels.insert)
+
+    def path(self, entry):
+        return arena_path(self.arena_node, self.arena_parent, entry)
+
+    def state(self):
+        """Return the search state for a checkpoint, see ``search_state``."""
+        return self.snapshot(self.q, self.arena_node, self.arena_parent, self.labels, self.front, self.width,
+                             self.expansions, self.current_best, self.best_entry, self.finished,
+                             self.weight, self.upper_bound)
+
+    def publish_path(self, event, entry, coverage, score, elapsed):
+        """Publish an ``improved`` or ``finished`` event with the path ending at arena ``entry``, if there is a publisher."""
+        if self.publish is not None:
+            self.publish(event, coverage=coverage, score=score, elapsed=elapsed, expansions=self.expansions,
+                         path=self.path(entry))
+
+    def run(self):
+        """
+        Pop states until the driver stops the search or the frontier runs out.
+
+        Returns:
+            list: see ``result``
+        """
+        options = self.options
+        if options.profile:
+            finish = self.finish_profile
+        elif options.anytime:
+            finish = self.finish_anytime
+        else:
+            finish = self.finish_first
+        maintain = options.metrics is not None or options.checkpoint is not None or \
+            options.max_frontier is not None or bool(options.beam_width) or options.max_expansions is not None
+        publish, progress_every, target = self.publish, options.progress_every, options.target_coverage
+        report = publish is not None and bool(progress_every)
+        sample = publish is not None and not options.output_best_path
+        goal, heappop, expand = self.goal, self.heappop, self.expand
+
+        while self.q:
+            if maintain and self.maintain(): break
+            q, labels = self.q, self.labels
+            score, entry, total_time, visited, traversed, depth = heappop(q)
+            if labels.is_dead(entry): continue
+            self.expansions += 1
+            coverage = visited.bit_count()
+            if report and self.expansions % progress_every == 0:
+                publish("progress", coverage=coverage, score=score, expansions=self.expansions, frontier=len(q),
+                        labels=labels.report(), path=self.path(entry))
+            if sample and random.random() < 0.001:
+                publish("sample", coverage=coverage, score=score, expansions=self.expansions, path=self.path(entry))
+            if coverage > self.current_best:
+                self.current_best = coverage
+                self.best_entry = entry
+                if options.metrics is not None:
+                    options.metrics.improved(self.expansions, coverage)
+                if options.output_best_path:
+                    self.publish_path("improved", entry, coverage, score, total_time)
+                if target is not None and coverage >= target:
+                    break
+            if visited == goal:
+                if finish(entry, total_time, coverage, score): break
+                continue
+            expand(entry, total_time, visited, traversed, depth)
+        return self.result()
+
+    def maintain(self):
+        """
+        Record the metrics, save a due checkpoint and trim an oversized frontier.
+
+        Returns:
+            bool: the expansion limit is reached
+        """
+        options = self.options
+        if options.metrics is not None:
+            options.metrics.observe(self.expansions, len(self.q), self.current_best, self.labels)
+        if options.checkpoint is not None and self.expansions % CHECKPOINT_EVERY == 0 and options.checkpoint.due():
+            options.checkpoint.save(self.state())
+        if (options.max_frontier is not None and len(self.q) > options.max_frontier) or \
+                (options.beam_width and len(self.q) > 2 * options.beam_width * (self.current_best + 2)):
+            self.q, self.labels, self.arena_node, self.arena_parent, self.best_entry, self.front = self.trim(
+                self.q, self.labels, self.arena_node, self.arena_parent, self.best_entry, self.front,
+                options.max_frontier, options.beam_width)
+            self.trims += 1
+            self.insert = self.timed("labels", self.labels.insert)
+        # stop before popping, so a checkpoint written after the loop keeps every state
+        return options.max_expansions is not None and self.expansions >= options.max_expansions
+
+    def finish_first(self, entry, total_time, coverage, score):
+        """Stop at the first complete path."""
+        self.finished = True
+        self.best_entry = entry
+        self.publish_path("finished", entry, coverage, score, total_time)
+        print("===== FINISHED =====")
+        return True
+
+    def finish_anytime(self, entry, total_time, coverage, score):
+        """Keep a faster complete path as the bound and re-order the frontier for a lower weight."""
+        # only keep paths at least a minute faster than the last
+        if self.upper_bound is not None and total_time >= self.upper_bound: return False
+        self.finished = True
+        self.best_entry = entry
+        self.publish_path("finished", entry, coverage, score, total_time)
+        print(f"===== {total_time:.0f} MINUTES (weight {self.weight}) =====")
+        self.upper_bound = total_time - 0.5
+        new_weight = max(1.0, self.weight - ANYTIME_STEP)
+        self.q, self.weight = reweight_frontier(self.q, self.weight, new_weight, self.upper_bound), new_weight
+        return False
+
+    def finish_profile(self, entry, total_time, coverage, score):
+        """Add a complete path to the (start, finish) front unless a point of it dominates the path."""
+        finish = self.node_time[self.arena_node[entry]]
+        start = round(finish - total_time)
+        if front_dominates(self.front, start, finish): return False
+        self.front = [point for point in self.front if not (start >= point[0] and finish <= point[1])]
+        self.front.append((start, finish, entry))
+        self.finished = True
+        self.publish_path("finished", entry, coverage, score, total_time)
+        return False
+
+    def expand(self, entry, total_time, visited, traversed, depth):
+        """Push the successors of a popped state that are not pruned by the bounds, the front or the labels."""
+        node_station, node_time, bits, station_of = self.node_station, self.node_time, self.bits, self.station_of
+        arena_node, arena_parent, q, insert, heappush = \
+            self.arena_node, self.arena_parent, self.q, self.insert, self.heappush
+        heuristic, upper_bound, weight, front = self.heuristic, self.upper_bound, self.weight, self.front
+        station_num, every_stop = self.station_num, self.every_stop
+        node = arena_node[entry]
+        station = node_station[node]
+        from_start = self.from_super_source and node == self.source
+
+        for successor, edge_time, _ in self.out_edges(node):
+            successor_time = node_time[successor]
+            if arena_contains(arena_node, arena_parent, node_time, entry, successor): continue
+
+            if from_start:
+                edge_time = (successor_time - 6*60) * START_TIME_MULTIPLIER
+            new_time = total_time + edge_time
+            new_bit = bits[node_station[successor]]
+            is_new = not visited & new_bit
+            new_visited = visited
+            if every_stop:
+                if is_new and new_bit == bits[station] and edge_time > STOP_TIME:
+                    new_visited = visited | new_bit
+            else:
+                new_visited = visited | new_bit
+
+            delta_stations = 0
+            if is_new:
+                delta_stations = 1 + self.skipped.get((station, node_station[successor]), 0)
+
+            new_traversed = traversed + delta_stations
+            estimate = 0
+            if heuristic is None:
+                new_score = new_time * TIME_MULTIPLIER + (station_num - new_traversed) * STATION_MULTIPLIER + (depth + 1) * PATH_MULTIPLIER
+            else:
+                estimate = heuristic(station_of[node_station[successor]], new_visited, successor_time)
+                if estimate == INFINITY: continue
+                if upper_bound is not None and new_time + estimate > upper_bound: continue
+                new_score = new_time + weight * estimate
+            if front and front_dominates(front, round(successor_time - new_time), successor_time + estimate): continue
+
+            if not insert(successor, new_visited, new_time, len(arena_node)): continue
+            arena_node.append(successor)
+            arena_parent.append(entry)
+            heappush(q, (new_score, len(arena_node) - 1, new_time, new_visited, new_traversed, depth + 1))
+
+    def result(self):
+        """
+        Save the last checkpoint and report the search.
+
+        Returns:
+            list: the best path found, as node IDs; with ``profile`` the front
+            as ``(start, finish, path)`` tuples, earliest start first
+        """
+        options = self.options
+        if options.metrics is not None:
+            options.metrics.close(self.expansions, len(self.q), self.current_best, self.labels)
+        if options.checkpoint is not None:
+            options.checkpoint.save(self.state())
+        if not self.finished and self.upper_bound is not None:
+            print(f"No complete route within {self.upper_bound} minutes")
+        if options.anytime and self.finished and not self.q and not self.trims:
+            print("Frontier exhausted: the last route is optimal")
+        if self.trims:
+            print(f"Frontier trimmed {self.trims} times, {len(self.arena_node)} arena records kept")
+        if options.profile:
+            print(f"Dominance pruning: {self.labels.report()}")
+            return [(start, finish, self.path(entry)) for start, finish, entry in sorted(self.front)]
+        best_path = self.path(self.best_entry)
+        print([self.G.node_name(n) for n in best_path])
+        print(f"Dominance pruning: {self.labels.report()}")
+        return best_path
+
+
+def a_star(G: MetroGraph, source, stations_index, every_stop=False, segments=None, heuristic=None,
+           options=SearchOptions()):
+    """
+    Search for the fastest path visiting every station in ``stations_index``.
+
+    A search state is ``(node, elapsed time, visited mask, traversed, depth)``
+    where bit ``stations_index[station]`` of the visited mask marks a visited
+    station. Paths are not copied into states: every pushed state appends
+    one ``(node, parent)`` record to an arena and paths are rebuilt from the
+    parent pointers when they are written out. States dominated by another
+    state at the same node (see ``ParetoLabels``) are never expanded.
+
+    Args:
+        G (MetroGraph): time-expanded graph, or a ``LazyGraph`` generating it on demand
+        source (int): start node, typically the super-source from ``add_source``
+        stations_index (dict): station code -> index of its bit in the visited mask
+        every_stop (bool): only count a station once the path has stopped there
+        segments (dict): ``{(from, to): (stations skipped, minutes)}`` of a graph
+            built with SUPPRESS (``BuiltGraph.segments``); riding such a hop
+            credits the skipped stations to the weighted score
+        heuristic (callable): admissible ``heuristic(station_index, visited, minute)``
+            lower bound from ``heuristics.build_heuristic``; states are then
+            ordered by elapsed time plus the bound, so the first complete
+            path popped is optimal. None keeps the weighted score.
+        options (SearchOptions): the optional modes, all off by default:
+
+            - progress (ProgressPublisher): receives ``improved``/``sample``/
+              ``progress``/``finished`` events; the search only enqueues
+              them, sinks do the I/O
+            - output_best_path (bool): publish every coverage improvement,
+              otherwise publish a random 0.1% of the popped paths as samples
+            - progress_every (int): publish a progress event every this many pops
+            - upper_bound (float): with a heuristic, drop states that cannot
+              finish within this many minutes; an exhausted search proves no
+              such route exists
+            - max_expansions (int): stop after popping this many states,
+              counting the states popped before a resume
+            - target_coverage (int): stop at the first path visiting this
+              many stations, e.g. for benchmarks
+            - profile (bool): keep searching past the first complete path for
+              the Pareto front of (start, finish) over the trip starts linked
+              to ``source``. At a node the elapsed time of a label is the node
+              time minus its start, so labels of neighbouring starts prune
+              each other through ``ParetoLabels`` and one search covers the
+              whole window. States that cannot beat a point of the front are
+              dropped.
+            - anytime (bool): with a heuristic, keep searching after a
+              complete path: every better path is published as ``finished``
+              and becomes the upper bound, the weight drops by
+              ``ANYTIME_STEP`` towards 1 and the frontier is re-ordered. An
+              exhausted search proves the last path optimal.
+            - weight (float): with a heuristic, order states by elapsed time
+              plus ``weight`` times the bound; above 1 complete paths are
+              found sooner but are only within ``weight`` times the optimum
+            - max_frontier (int): hard limit on the states in the frontier;
+              when it is exceeded the frontier is trimmed (``trim_frontier``)
+              to its best ``FRONTIER_TRIM`` share. ``max_frontier *
+              STATE_BYTES`` is roughly the memory the search then needs.
+            - beam_width (int): beam search, keep only the best this many
+              states of every coverage level
+            - checkpoint (Checkpointer): save the search state whenever its
+              interval has passed, and once more when the search stops
+            - resume (dict): state from ``checkpoint.load_checkpoint`` to
+              continue instead of starting at ``source``; a finished search
+              returns its result right away
+            - metrics (SearchMetrics): collect ``instrument`` counters and
+              samples; with its timers, the heap, edge, label, heuristic,
+              publish, checkpoint and trim calls are timed per phase
+
+    Returns:
+        list: the best path found, as node IDs; with ``profile`` the front as
+        ``(start, finish, path)`` tuples, earliest start first
+    """
+    return CoverageSearch(G, source, stations_index, every_stop, segments, heuristic, options).run()
@@ -0,0 +1,251 @@
+import copy
+import json
+import os
+from collections import namedtuple
+import numpy as np
+from metro_graph import build_metro_graph, save_snapshot, load_snapshot, SNAPSHOT_VERSION
+from lazy_graph import LazyGraph, ADJACENCY_CACHE_SIZE
+from coverage_search import build_stations_index
+from stage_cache import StageCache, file_digest, stage_key
+from merge_raw_data import load_merged, merged_file, to_raw_data, Schedule, NO_TIME
+
+KEEP_RULES = ("transfers", "terminals", "branches")
+TEST_TRAINS = slice(50, 80)
+
+BuiltGraph = namedtuple("BuiltGraph", ["graph", "raw_data", "transfer_time", "stations_index", "snapshot", "segments"])
+
+# in-process memo, keyed by the prepare stage key
+_built = {}
+
+
+def keep_mask(line, schedule, transfer_time, rules=KEEP_RULES, keep_stations=()):
+    """
+    Return the boolean mask of the stations of ``line`` that SUPPRESS and SIMPLIFY keep.
+
+    Rules:
+        transfers: stations with more than one transfer in ``transfer_time``
+        terminals: the first and last station of the line
+        branches: both ends of a hop no train rides (e.g. the end of one
+            branch listed next to the start of another) and both ends of
+            every jump a train makes over stations it does not serve
+
+    Args:
+        line (str): line direction, e.g. "O_a"
+        schedule (Schedule): stations and trains x stations time matrix
+        transfer_time (dict): transfer walking times
+        rules (tuple): names of the rules to apply
+        keep_stations (tuple): station codes to keep in any case
+    """
+    stations, times = schedule
+    served = times != NO_TIME
+    keep = np.isin(stations, keep_stations)
+    if "transfers" in rules:
+        keep |= np.array([len(transfer_time.get(line, {}).get(station, {})) > 1 for station in stations], dtype=bool)
+    if "terminals" in rules:
+        keep[[0, -1]] = True
+    if "branches" in rules and len(stations) > 1:
+        unridden = ~(served[:, :-1] & served[:, 1:]).any(axis=0)
+        # holes: unserved stations with a served station before and after them
+        before = np.logical_or.accumulate(served, axis=1)
+        after = np.logical_or.accumulate(served[:, ::-1], axis=1)[:, ::-1]
+        hole = ~served & before & after
+        keep[:-1] |= unridden | (served[:, :-1] & hole[:, 1:]).any(axis=0)
+        keep[1:] |= unridden | (hole[:, :-1] & served[:, 1:]).any(axis=0)
+    return keep
+
+
+def compact_schedule(schedule, keep):
+    """
+    Drop the stations outside ``keep`` from a schedule.
+
+    Returns:
+        tuple: the compacted Schedule and the side table of the hops it
+        creates, ``{(from, to): (stations skipped, minimum ride minutes)}``
+        for every hop that skips at least one served station
+    """
+    stations, times = schedule
+    columns = np.flatnonzero(keep)
+    served = times != NO_TIME
+    # served[:, :c].sum(axis=1) for every column c
+    served_before = np.concatenate([np.zeros((len(times), 1), dtype=np.int32), np.cumsum(served, axis=1)], axis=1)
+
+    # consecutive served kept stations of every train, in row-major order
+    rows, kept = np.nonzero(served[:, columns])
+    hop = rows[1:] == rows[:-1]
+    rows, start, end = rows[1:][hop], columns[kept[:-1][hop]], columns[kept[1:][hop]]
+    skipped = served_before[rows, end] - served_before[rows, start + 1]
+    minutes = times[rows, end] - times[rows, start]
+
+    # one side-table row per distinct (start, end) hop
+    skips = skipped > 0
+    hops = start[skips] * len(stations) + end[skips]
+    order = np.argsort(hops, kind="stable")
+    hops, first = np.unique(hops[order], return_index=True)
+    counts = np.maximum.reduceat(skipped[skips][order], first) if len(hops) else hops
+    rides = np.minimum.reduceat(minutes[skips][order], first) if len(hops) else hops
+    segments = {(stations[hop // len(stations)], stations[hop % len(stations)]): (count, ride)
+                for hop, count, ride in zip(hops.tolist(), counts.tolist(), rides.tolist())}
+
+    return Schedule([stations[column] for column in columns], times[:, columns]), segments
+
+
+def add_reciprocal_transfers(schedules, transfer_time, keep=None):
+    """
+    Link stations to the same station of the opposite direction with a 0-minute transfer.
+
+    With ``keep`` (``{line: keep_mask}``) only kept stations get the link,
+    which is where the simplified graph keeps its transfer nodes.
+    ``transfer_time`` is modified in place.
+    """
+    for line in schedules:
+        reciprocal = line.replace("_a", "_b") if "_a" in line else line.replace("_b", "_a")
+        stations = schedules[line].stations
+
+        if line not in transfer_time:
+            transfer_time[line] = {}
+        for index, station in enumerate(stations):
+            if station not in transfer_time[line]:
+                transfer_time[line][station] = {}
+            if keep is None or keep[line][index]:
+                dest_line_station = f"{reciprocal}_{station}"
+                if dest_line_station not in transfer_time[line][station]:
+                    transfer_time[line][station][dest_line_station] = 0
+    return transfer_time
+
+
+def prepare_schedule(schedules, transfer_time, simplify=True, suppress=False, test_data=False,
+                     rules=KEEP_RULES, keep_stations=()):
+    """
+    Apply the SUPPRESS, TEST_DATA and SIMPLIFY options to a schedule.
+
+    SUPPRESS drops lines without transfers and every station outside
+    ``keep_mask``; SIMPLIFY only links the kept stations of both directions.
+
+    Returns:
+        tuple: ``(raw_data, transfer_time, segments)`` with the schedule dict
+        for ``build_metro_graph`` and the ``compact_schedule`` side table of
+        all lines; the arguments are left untouched
+    """
+    transfer_time = copy.deepcopy(transfer_time)
+    keep = {line: keep_mask(line, schedule, transfer_time, rules, keep_stations)
+            for line, schedule in schedules.items()}
+    segments = {}
+    if suppress:
+        compacted = {}
+        for line, schedule in schedules.items():
+            if line not in transfer_time: continue
+            compacted[line], line_segments = compact_schedule(schedule, keep[line])
+            segments.update(line_segments)
+            keep[line] = np.ones(len(compacted[line].stations), dtype=bool)
+        schedules = compacted
+    if test_data:
+        schedules = {line: Schedule(schedule.stations, schedule.times[TEST_TRAINS])
+                     for line, schedule in schedules.items()}
+    add_reciprocal_transfers(schedules, transfer_time, keep if simplify else None)
+    return to_raw_data(schedules), transfer_time, segments
+
+
+def prepare_stage(days, simplify=True, suppress=False, test_data=False, data_dir="working",
+                  rules=KEEP_RULES, keep_stations=()):
+    """
+    Return the "prepare" stage of ``build_graph``.
+
+    Returns:
+        tuple: ``(key, run)``; ``run(cache)`` fetches the prepared schedule
+        from the ``StageCache``, running ``prepare_schedule`` on a miss, and
+        returns ``(raw_data, transfer_time, segments)``
+    """
+    schedule_file = merged_file(days, data_dir)
+    transfer_file = os.path.join(data_dir, "transfer_time.json")
+    options = {"simplify": simplify, "suppress": suppress, "test_data": test_data,
+               "rules": sorted(rules), "keep_stations": sorted(keep_stations)}
+    key = stage_key("prepare", [file_digest(schedule_file), file_digest(transfer_file)], options)
+
+    def prepare(filename):
+        with open(transfer_file, "r") as f:
+            transfer_time = json.load(f)
+        raw_data, transfer_time, segments = prepare_schedule(load_merged(schedule_file), transfer_time, simplify,
+                                                             suppress, test_data, rules, keep_stations)
+        with open(filename, "w") as f:
+            json.dump({"raw_data": raw_data, "transfer_time": transfer_time,
+                       "segments": [[a, b, count, ride] for (a, b), (count, ride) in segments.items()]},
+                      f, separators=(",", ":"))
+
+    def run(cache):
+        with open(cache.fetch("prepare", key, ".json", prepare), "r") as f:
+            prepared = json.load(f)
+        segments = {(a, b): (count, ride) for a, b, count, ride in prepared["segments"]}
+        return prepared["raw_data"], prepared["transfer_time"], segments
+
+    return key, run
+
+
+def build_graph(days, simplify=True, suppress=False, test_data=False, data_dir="working", cache=None,
+                rules=KEEP_RULES, keep_stations=()):
+    """
+    Build the time-expanded graph of the merged schedule ``days`` in ``data_dir``, memoised.
+
+    Runs two stages of a ``StageCache``: "prepare" (``prepare_schedule``,
+    keyed by the schedule file, ``transfer_time.json`` and the options) and
+    "graph" (the snapshot, keyed by the prepared schedule). Results are also
+    kept in memory for the process, and other processes only have to map
+    the cached snapshot.
+
+    Args:
+        days (str): schedule to use, e.g. "12345" or "67"
+        simplify (bool): only keep transfer nodes at key stations
+        suppress (bool): only keep key stations in the schedule
+        test_data (bool): only keep trains 50 to 80 of every line
+        data_dir (str): directory holding ``{days}.npz`` (or ``{days}.json``) and ``transfer_time.json``
+        cache (StageCache): stage output cache, ``working/cache`` by default
+        rules (tuple): ``keep_mask`` rules deciding the key stations
+        keep_stations (tuple): station codes to keep in any case
+
+    Returns:
+        BuiltGraph: the graph, the prepared schedule and transfer times it
+        was built from, its stations index, the snapshot filename and the
+        ``compact_schedule`` side table of the hops SUPPRESS created
+    """
+    cache = cache or StageCache()
+    prepared_key, prepared = prepare_stage(days, simplify, suppress, test_data, data_dir, rules, keep_stations)
+    if prepared_key in _built:
+        return _built[prepared_key]
+    raw_data, transfer_time, segments = prepared(cache)
+
+    def graph(filename):
+        save_snapshot(build_metro_graph(raw_data, transfer_time, simplify=simplify), filename)
+
+    graph_key = stage_key("graph", [prepared_key], {"simplify": simplify, "snapshot": SNAPSHOT_VERSION})
+    snapshot = cache.fetch("graph", graph_key, ".bin", graph)
+
+    built = BuiltGraph(load_snapshot(snapshot), raw_data, transfer_time,
+                       build_stations_index(raw_data, transfer_time), snapshot, segments)
+    _built[prepared_key] = built
+    return built
+
+
+def lazy_graph(days, simplify=True, suppress=False, test_data=False, data_dir="working", cache=None,
+               rules=KEEP_RULES, keep_stations=(), cache_size=ADJACENCY_CACHE_SIZE):
+    """
+    Like ``build_graph``, but with a ``LazyGraph`` that generates the graph during the search.
+
+    Only the "prepare" stage runs; the returned BuiltGraph has no snapshot.
+    """
+    _, prepared = prepare_stage(days, simplify, suppress, test_data, data_dir, rules, keep_stations)
+    raw_data, transfer_time, segments = prepared(cache or StageCache())
+    return BuiltGraph(LazyGraph(raw_data, transfer_time, simplify, cache_size), raw_data, transfer_time,
+                      build_stations_index(raw_data, transfer_time), None, segments)
+
+
+def source_graph(built, start=None, end=None):
+    """
+    Add the super-source to a built graph.
+
+    Returns:
+        tuple: ``(graph, source node, stations index)``; the index is a copy
+        with an extra bit for the source station
+    """
+    stations_index = dict(built.stations_index)
+    stations_index["source"] = max(stations_index.values()) + 1
+    G, source = built.graph.add_source(start, end)
+    return G, source, stations_index
@@ -0,0 +1,247 @@
+import heapq
+from functools import lru_cache
+from travel_times import TravelTimes, tables_file, UNREACHABLE
+
+INFINITY = float("inf")
+HEURISTIC_CACHE_SIZE = 1 << 16
+
+
+def ride_graph(raw_data, transfer_time, stations_index):
+    """
+    Return the cheapest hop between station indices as ``{a: {b: minutes}}``.
+
+    Hops are the minimum in-vehicle time between consecutive served stations
+    over every train of every line, plus the walking times of
+    ``transfer_time``. Waiting is ignored, so every hop is a lower bound.
+    """
+    hops = {}
+
+    def add(a, b, time):
+        if a == b: return
+        if time < hops.setdefault(a, {}).get(b, INFINITY):
+            hops[a][b] = time
+
+    for line in raw_data:
+        stations = [stations_index[station] for station in raw_data[line]["stations"]]
+        for train in raw_data[line]["trainSchedules"]:
+            prev_index = None
+            for index, time in enumerate(train):
+                if time is None: continue
+                if prev_index is not None:
+                    add(stations[prev_index], stations[index], time - train[prev_index])
+                prev_index = index
+
+    for line in transfer_time:
+        for station in transfer_time[line]:
+            if station not in stations_index: continue
+            for dest_line_station, time in transfer_time[line][station].items():
+                dest_station = dest_line_station.rsplit("_", 1)[1]
+                if dest_station in stations_index:
+                    add(stations_index[station], stations_index[dest_station], time)
+
+    return hops
+
+
+def all_pairs(hops, station_num):
+    """Dijkstra from every station index; returns a ``station_num`` x ``station_num`` list of lists."""
+    dist = []
+    for source in range(station_num):
+        row = [INFINITY] * station_num
+        row[source] = 0
+        q = [(0, source)]
+        while q:
+            d, a = heapq.heappop(q)
+            if d > row[a]: continue
+            for b, time in hops.get(a, {}).items():
+                if d + time < row[b]:
+                    row[b] = d + time
+                    heapq.heappush(q, (d + time, b))
+        dist.append(row)
+    return dist
+
+
+def mask_indices(mask):
+    """Return the indices of the set bits of ``mask``."""
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+class LowerBounds:
+    """
+    Admissible lower bounds on the time still needed to visit every station.
+
+    All bounds are functions of the current station index and the visited
+    mask of a search state and never overestimate, so plugging any of them
+    into ``coverage_search.a_star`` makes it a proper A* search.
+
+    Args:
+        raw_data (dict): schedule data the graph was built from
+        transfer_time (dict): transfer walking times
+        stations_index (dict): station code -> bit index, as used by the search
+    """
+
+    def __init__(self, raw_data, transfer_time, stations_index):
+        self.station_num = max(stations_index.values()) + 1
+        self.goal = (1 << self.station_num) - 1
+        self.dist = all_pairs(ride_graph(raw_data, transfer_time, stations_index), self.station_num)
+
+        # indices that are not stations of the schedule (the super-source)
+        # can start anywhere
+        scheduled = {stations_index[station] for line in raw_data for station in raw_data[line]["stations"]}
+        for index in range(self.station_num):
+            if index not in scheduled:
+                self.dist[index] = [0] * self.station_num
+
+        # stations ordered farthest-first from every station: the farthest
+        # unvisited station is the first unvisited entry
+        self.farthest_order = [sorted(range(self.station_num), key=lambda b: -row[b]) for row in self.dist]
+
+        self.terminal_mask = 0
+        transfer_count = {}
+        for line in raw_data:
+            stations = raw_data[line]["stations"]
+            self.terminal_mask |= 1 << stations_index[stations[0]]
+            self.terminal_mask |= 1 << stations_index[stations[-1]]
+            for station in stations:
+                transfer_count.setdefault(stations_index[station], set()).add(line.split("_")[0])
+        self.terminal_order = [[b for b in order if self.terminal_mask >> b & 1] for order in self.farthest_order]
+
+        # the MST bound runs over terminals and transfer stations only
+        self.key_mask = self.terminal_mask
+        for index, lines in transfer_count.items():
+            if len(lines) > 1:
+                self.key_mask |= 1 << index
+        self.nearest_key_order = [[b for b in reversed(order) if self.key_mask >> b & 1] for order in self.farthest_order]
+        self.mst_cache = lru_cache(maxsize=HEURISTIC_CACHE_SIZE)(self._mst)
+
+    def zero(self, station, visited, minute=None):
+        return 0
+
+    def farthest(self, station, visited, minute=None):
+        """Time to reach the farthest unvisited station."""
+        row = self.dist[station]
+        for b in self.farthest_order[station]:
+            if not visited >> b & 1:
+                return row[b]
+        return 0
+
+    def terminals(self, station, visited, minute=None):
+        """Time to reach the farthest unvisited line terminal."""
+        row = self.dist[station]
+        for b in self.terminal_order[station]:
+            if not visited >> b & 1:
+                return row[b]
+        return 0
+
+    def _mst(self, key_unvisited):
+        """Weight of a minimum spanning tree over the stations of ``key_unvisited`` (Prim)."""
+        nodes = mask_indices(key_unvisited)
+        if len(nodes) < 2:
+            return 0
+        dist = self.dist
+        best = {b: min(dist[nodes[0]][b], dist[b][nodes[0]]) for b in nodes[1:]}
+        total = 0
+        while best:
+            b = min(best, key=best.get)
+            total += best.pop(b)
+            for c in best:
+                d = min(dist[b][c], dist[c][b])
+                if d < best[c]:
+                    best[c] = d
+        return total
+
+    def mst(self, station, visited, minute=None):
+        """
+        Time to reach the nearest unvisited key station plus an MST over all of them.
+
+        Any route visiting every unvisited station also visits the unvisited
+        key stations, and such a route is a spanning path over them, so this
+        stays admissible. Restricting the tree to key stations keeps it cheap
+        and lets states share the cached tree per visited-mask bucket
+        (``visited & key_mask``).
+        """
+        key_unvisited = self.key_mask & ~visited & self.goal
+        if not key_unvisited:
+            return 0
+        row = self.dist[station]
+        for b in self.nearest_key_order[station]:
+            if key_unvisited >> b & 1:
+                return row[b] + self.mst_cache(key_unvisited)
+        return 0
+
+    def combined(self, station, visited, minute=None):
+        return max(self.farthest(station, visited), self.mst(station, visited))
+
+
+class TravelTimeBounds:
+    """
+    Time-dependent bound from the ``travel_times`` tables: the time to reach the farthest unvisited station.
+
+    Unlike ``LowerBounds`` it uses the minute of the state, so waiting for
+    trains and sparse late-evening service count; every lookup is one
+    ``TravelTimes.lower_bound``. The unvisited station with the largest
+    table entry is found from a per-bucket order of the stations, built
+    on first use. The tables must belong to the schedule being searched.
+
+    Args:
+        tables (TravelTimes): tables from ``travel_times.compute_tables``
+        stations_index (dict): station code -> bit index, as used by the search
+    """
+
+    def __init__(self, tables, stations_index):
+        self.tables = tables
+        station_num = max(stations_index.values()) + 1
+        # table index of every bit index, None for the super-source
+        self.table_index = [None] * station_num
+        for station, index in stations_index.items():
+            if station in tables.stations_index:
+                self.table_index[index] = tables.stations_index[station]
+        missing = [station for station in stations_index
+                   if station not in tables.stations_index and station != "source"]
+        if missing:
+            raise ValueError(f"travel-time tables have no entries for {missing[:5]}")
+        self.orders = {}
+
+    def order(self, bucket, origin):
+        """Bit indices by decreasing table entry from table index ``origin`` in ``bucket``, memoised."""
+        key = (bucket, origin)
+        if key not in self.orders:
+            row = self.tables.tables[bucket, origin]
+            indices = [b for b, t in enumerate(self.table_index) if t is not None and row[t] != UNREACHABLE]
+            self.orders[key] = sorted(indices, key=lambda b: -int(row[self.table_index[b]]))
+        return self.orders[key]
+
+    def farthest(self, station, visited, minute=None):
+        origin = self.table_index[station] if station is not None else None
+        if origin is None or minute is None:
+            return 0
+        for b in self.order(self.tables.bucket(minute), origin):
+            if not visited >> b & 1:
+                return self.tables.lower_bound(origin, self.table_index[b], minute)
+        return 0
+
+
+HEURISTICS = ["zero", "farthest", "terminals", "mst", "combined", "travel_times"]
+
+
+def build_heuristic(name, raw_data, transfer_time, stations_index, tables=None):
+    """
+    Return the ``heuristic(station_index, visited_mask, minute)`` callable named ``name``.
+
+    Args:
+        name (str): one of ``HEURISTICS``
+        raw_data (dict): schedule data the graph was built from
+        transfer_time (dict): transfer walking times
+        stations_index (dict): station code -> bit index, as used by the search
+        tables (str): ``compute_tables`` output for ``"travel_times"``,
+            ``travel_times.tables_file()`` by default
+    """
+    if name not in HEURISTICS:
+        raise ValueError(f"Unknown heuristic {name!r}, expected one of {HEURISTICS}")
+    if name == "travel_times":
+        return TravelTimeBounds(TravelTimes(tables or tables_file()), stations_index).farthest
+    return getattr(LowerBounds(raw_data, transfer_time, stations_index), name)
@@ -0,0 +1,130 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+METRICS_EVERY = 4096 # loop iterations between metrics samples
+PROFILE_LINES = 40 # functions listed in the text profile
+
+
+class SearchMetrics:
+    """
+    Counters, samples and optional phase timers of one search, written as JSON lines.
+
+    The search calls ``observe`` once per loop iteration and ``improved``
+    on every coverage improvement; every ``every`` iterations a sample with
+    the expansion rate, frontier size, heap peak, coverage and pruning
+    counters is written. With ``timers`` the search's hot calls are
+    wrapped by ``timed`` and their total time is reported per phase.
+    A search without metrics pays one ``is None`` check per iteration.
+
+    Args:
+        filename (str): metrics JSONL, or None to only keep the counters
+        every (int): iterations between samples
+        timers (bool): time the phases wrapped with ``timed``
+    """
+
+    def __init__(self, filename=None, every=METRICS_EVERY, timers=False):
+        self.file = open(filename, "w") if filename else None
+        self.every = every
+        self.timers = timers
+        self.phases = {}
+        self.iterations = 0
+        self.heap_peak = 0
+        self.coverage = []
+        self.start = time.perf_counter()
+        self.last = (self.start, 0)
+        self.summary = None
+
+    def timed(self, phase, function):
+        """Return ``function``, wrapped to add its time to ``phase`` when timers are on."""
+        if not self.timers:
+            return function
+        totals = self.phases.setdefault(phase, [0, 0.0])
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[0] += 1
+                totals[1] += clock() - start
+        return wrapper
+
+    def observe(self, expansions, frontier, coverage, labels):
+        self.iterations += 1
+        if frontier > self.heap_peak:
+            self.heap_peak = frontier
+        if self.iterations % self.every == 0:
+            self.sample(expansions, frontier, coverage, labels)
+
+    def improved(self, expansions, coverage):
+        seconds = time.perf_counter() - self.start
+        self.coverage.append((round(seconds, 3), expansions, coverage))
+        self.write({"event": "improved", "seconds": round(seconds, 3), "expansions": expansions, "coverage": coverage})
+
+    def sample(self, expansions, frontier, coverage, labels, event="sample"):
+        now = time.perf_counter()
+        last_time, last_expansions = self.last
+        self.last = (now, expansions)
+        record = {
+            "event": event,
+            "seconds": round(now - self.start, 3),
+            "expansions": expansions,
+            "rate": round((expansions - last_expansions) / max(now - last_time, 1e-9)),
+            "frontier": frontier,
+            "heap_peak": self.heap_peak,
+            "coverage": coverage,
+            "pushed": labels.kept,
+            "pruned": labels.pruned,
+            "superseded": labels.superseded,
+            "stale": self.iterations - expansions
+        }
+        self.write(record)
+        return record
+
+    def close(self, expansions, frontier, coverage, labels):
+        """Write and print the summary of the search."""
+        self.last = (self.start, 0) # the summary rate covers the whole search
+        summary = self.sample(expansions, frontier, coverage, labels, event="summary")
+        phases = {phase: totals for phase, totals in self.phases.items() if totals[0]}
+        if phases:
+            summary["phases"] = {phase: {"calls": calls, "seconds": round(seconds, 3)}
+                                 for phase, (calls, seconds) in phases.items()}
+            self.write({"event": "phases", "phases": summary["phases"]})
+        if self.file is not None:
+            self.file.close()
+        self.summary = summary
+        print(f"{expansions} expansions in {summary['seconds']:.1f}s ({summary['rate']}/s), "
+              f"heap peak {self.heap_peak}, {summary['stale']} stale pops")
+        for phase, (calls, seconds) in sorted(phases.items(), key=lambda item: -item[1][1]):
+            print(f"  {phase:10s} {calls:10d} calls {seconds:8.2f}s")
+
+    def write(self, record):
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def profiled(prefix):
+    """
+    Run the block under cProfile.
+
+    Writes ``{prefix}.prof`` (for pstats/snakeviz) and ``{prefix}.txt``,
+    the ``PROFILE_LINES`` functions with the most cumulative time.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{prefix}.prof")
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(text.getvalue())
+        print(f"Profile written to {prefix}.prof and {prefix}.txt")
@@ -0,0 +1,270 @@
+import copy
+import heapq
+import json
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from merge_raw_data import load_merged, merged_file, NO_TIME
+from graph_builder import add_reciprocal_transfers
+
+DAYS = "12345"
+ORIGIN = "R28"
+DESTINATION = "BL23"
+DEPARTURE = 8*60
+
+INFINITY = 1 << 30
+
+Journey = namedtuple("Journey", ["arrival", "path"])
+
+
+class StopTable:
+    """
+    Stops of a merged schedule and the transfers between them, shared by the planners.
+
+    A stop is a (line, station) pair, e.g. ``BL_a_BL12``: ``stop_id`` maps
+    its name to its index, ``stop_line`` and ``stop_station`` map back, and
+    ``station_stops`` lists the stops of every station code. ``transfers``
+    holds the ``(stop, other stop, minutes)`` walks of ``transfer_time``
+    plus 0-minute changes to the other direction of the same station;
+    ``transfer_time`` itself is left unchanged.
+
+    Args:
+        schedules (dict): ``{line: Schedule}`` from ``merge_raw_data.load_merged``
+        transfer_time (dict): transfer walking times
+    """
+
+    def __init__(self, schedules, transfer_time):
+        transfer_time = add_reciprocal_transfers(schedules, copy.deepcopy(transfer_time))
+
+        self.stop_line = []
+        self.stop_station = []
+        self.stop_id = {}
+        for line, schedule in schedules.items():
+            for station in schedule.stations:
+                self.stop_id[f"{line}_{station}"] = len(self.stop_line)
+                self.stop_line.append(line)
+                self.stop_station.append(station)
+        self.station_stops = {}
+        for stop, station in enumerate(self.stop_station):
+            self.station_stops.setdefault(station, []).append(stop)
+
+        self.transfers = []
+        for line in transfer_time:
+            for station, destinations in transfer_time[line].items():
+                stop = self.stop_id.get(f"{line}_{station}")
+                if stop is None: continue
+                for dest_line_station, minutes in destinations.items():
+                    if dest_line_station in self.stop_id:
+                        self.transfers.append((stop, self.stop_id[dest_line_station], minutes))
+
+    @classmethod
+    def from_days(cls, days, data_dir="working"):
+        with open(os.path.join(data_dir, "transfer_time.json"), "r") as f:
+            transfer_time = json.load(f)
+        return cls(load_merged(merged_file(days, data_dir)), transfer_time)
+
+
+class ConnectionScan(StopTable):
+    """
+    Earliest-arrival journeys with the Connection Scan Algorithm.
+
+    Every hop of every train between two consecutive served stations is a
+    connection; all connections are kept in arrays sorted by departure, so
+    a query only scans the connections leaving between the departure time
+    and the arrival at the destination. Changing between the stops of
+    ``StopTable`` uses its ``transfers``, closed transitively like the
+    transfer edges of the graph.
+
+    Itineraries use the node IDs of the time-expanded graph,
+    ``{line}_{station}_{time}``.
+
+    Args:
+        schedules (dict): ``{line: Schedule}`` from ``merge_raw_data.load_merged``
+        transfer_time (dict): transfer walking times
+    """
+
+    def __init__(self, schedules, transfer_time):
+        super().__init__(schedules, transfer_time)
+
+        footpaths = [[] for _ in self.stop_line]
+        for stop, other, minutes in self.transfers:
+            footpaths[stop].append((other, minutes))
+        self.footpaths = [closure(footpaths, stop) for stop in range(len(footpaths))]
+
+        # connections in trip order: consecutive served stations of every train
+        dep_stop, arr_stop, dep_time, arr_time, trip = [], [], [], [], []
+        trip_count = 0
+        for line, schedule in schedules.items():
+            stops = np.array([self.stop_id[f"{line}_{station}"] for station in schedule.stations], dtype=np.int32)
+            rows, columns = np.nonzero(schedule.times != NO_TIME)
+            hop = rows[1:] == rows[:-1]
+            start, end, rows = columns[:-1][hop], columns[1:][hop], rows[1:][hop]
+            dep_stop.append(stops[start])
+            arr_stop.append(stops[end])
+            dep_time.append(schedule.times[rows, start])
+            arr_time.append(schedule.times[rows, end])
+            trip.append(rows + trip_count)
+            trip_count += len(schedule.times)
+        self.trip_count = trip_count
+
+        dep_time = np.concatenate(dep_time).astype(np.int32)
+        order = np.argsort(dep_time, kind="stable")
+        self.dep_times = dep_time[order]
+        self.position = order.tolist() # sorted index -> trip-order index
+        self.trip_order = np.empty(len(order), dtype=np.int64) # trip-order index -> sorted index
+        self.trip_order[order] = np.arange(len(order))
+        self.trip_order = self.trip_order.tolist()
+
+        # plain lists: the scan loop indexes them one element at a time
+        self.connections = list(zip(np.concatenate(dep_stop)[order].tolist(), np.concatenate(arr_stop)[order].tolist(),
+                                    self.dep_times.tolist(), np.concatenate(arr_time)[order].tolist(),
+                                    np.concatenate(trip)[order].tolist()))
+
+    def scan(self, origin, departure, destinations=(), until=None):
+        """
+        Run one scan from station ``origin`` leaving at or after ``departure``.
+
+        ``origin`` may also be a list of stations that all start at
+        ``departure``, e.g. the codes of one interchange. Stops scanning
+        once every stop of the ``destinations`` stations is settled, or at
+        the first connection departing after ``until``; with neither the
+        scan is one-to-all.
+
+        Returns:
+            tuple: ``(arrival, journey)`` per stop; ``journey[stop]`` is
+            ``(boarding, alighting)`` sorted connection indices of the ride
+            that reached it, ``(-1, from stop)`` for a walk, or None
+        """
+        arrival = [INFINITY] * len(self.stop_line)
+        journey = [None] * len(self.stop_line)
+        boarded = {}
+        footpaths = self.footpaths
+        origins = [origin] if isinstance(origin, str) else origin
+        origin_stops = [stop for station in origins for stop in self.station_stops[station]]
+        for stop in origin_stops:
+            arrival[stop] = departure
+        for stop in origin_stops:
+            for other, minutes in footpaths[stop]:
+                if departure + minutes < arrival[other]:
+                    arrival[other] = departure + minutes
+                    journey[other] = (-1, stop)
+
+        # the scan can stop once no connection departs before the latest
+        # of the destinations' earliest arrivals
+        destinations = [self.station_stops[station] for station in destinations]
+        target_stops = {stop for stops in destinations for stop in stops}
+        limit = INFINITY if destinations else None
+        if until is not None:
+            limit = min(limit or INFINITY, until + 1)
+
+        connections = self.connections
+        first = int(np.searchsorted(self.dep_times, departure, side="left"))
+        for index in range(first, len(connections)):
+            dep_stop, arr_stop, dep_time, arr_time, trip = connections[index]
+            if limit is not None and dep_time >= limit:
+                break
+            if trip not in boarded:
+                if arrival[dep_stop] > dep_time: continue
+                boarded[trip] = index
+            if arr_time < arrival[arr_stop]:
+                arrival[arr_stop] = arr_time
+                journey[arr_stop] = (boarded[trip], index)
+                improved = arr_stop in target_stops
+                for stop, minutes in footpaths[arr_stop]:
+                    if arr_time + minutes < arrival[stop]:
+                        arrival[stop] = arr_time + minutes
+                        journey[stop] = (-1, arr_stop)
+                        improved = improved or stop in target_stops
+                if improved and destinations:
+                    limit = max(min(arrival[stop] for stop in stops) for stops in destinations)
+                    if until is not None:
+                        limit = min(limit, until + 1)
+        return arrival, journey
+
+    def itinerary(self, journey, stop):
+        """Rebuild the node IDs of the journey ending at ``stop``."""
+        legs = []
+        while journey[stop] is not None:
+            boarding, alighting = journey[stop]
+            if boarding == -1:
+                stop = alighting
+                continue
+            legs.append((boarding, alighting))
+            stop = self.connections[boarding][0]
+        path = []
+        for boarding, alighting in reversed(legs):
+            for position in range(self.position[boarding], self.position[alighting] + 1):
+                dep_stop, _, dep_time, _, _ = self.connections[self.trip_order[position]]
+                path.append(f"{self.stop_line[dep_stop]}_{self.stop_station[dep_stop]}_{dep_time}")
+            _, arr_stop, _, arr_time, _ = self.connections[alighting]
+            path.append(f"{self.stop_line[arr_stop]}_{self.stop_station[arr_stop]}_{arr_time}")
+        return path
+
+    def best_stop(self, arrival, station):
+        return min(self.station_stops[station], key=lambda stop: arrival[stop])
+
+    def journey(self, arrival, journey, destination):
+        stop = self.best_stop(arrival, destination)
+        if arrival[stop] == INFINITY:
+            return Journey(None, [])
+        return Journey(arrival[stop], self.itinerary(journey, stop))
+
+    def query(self, origin, destination, departure):
+        """
+        Earliest-arrival itinerary from station ``origin`` to station ``destination``.
+
+        Returns:
+            Journey: the arrival minute and the node IDs of the rides, which
+            are empty when ``destination`` is reached by walking alone;
+            ``Journey(None, [])`` when it cannot be reached
+        """
+        arrival, journey = self.scan(origin, departure, [destination])
+        return self.journey(arrival, journey, destination)
+
+    def batch(self, queries):
+        """
+        Answer many ``(origin, destination, departure)`` queries, in order.
+
+        Queries sharing an origin and departure time share one scan.
+        """
+        groups = {}
+        for i, (origin, destination, departure) in enumerate(queries):
+            groups.setdefault((origin, departure), []).append((i, destination))
+        results = [None] * len(queries)
+        for (origin, departure), members in groups.items():
+            arrival, journey = self.scan(origin, departure, {destination for _, destination in members})
+            for i, destination in members:
+                results[i] = self.journey(arrival, journey, destination)
+        return results
+
+
+def closure(footpaths, source):
+    """Shortest walks from stop ``source`` over any number of footpaths (Dijkstra)."""
+    best = {source: 0}
+    q = [(0, source)]
+    while q:
+        minutes, stop = heapq.heappop(q)
+        if minutes > best[stop]: continue
+        for other, walk in footpaths[stop]:
+            if minutes + walk < best.get(other, INFINITY):
+                best[other] = minutes + walk
+                heapq.heappush(q, (minutes + walk, other))
+    return [(stop, minutes) for stop, minutes in best.items() if stop != source]
+
+
+def main():
+    planner = ConnectionScan.from_days(DAYS)
+    start = time.perf_counter()
+    arrival, path = planner.query(ORIGIN, DESTINATION, DEPARTURE)
+    elapsed = time.perf_counter() - start
+    if arrival is None:
+        print(f"No journey from {ORIGIN} to {DESTINATION} after {DEPARTURE // 60:02d}:{DEPARTURE % 60:02d}")
+        return
+    print(path)
+    print(f"{ORIGIN} -> {DESTINATION}: arrive {arrival // 60:02d}:{arrival % 60:02d} "
+          f"({len(planner.connections)} connections, {elapsed * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
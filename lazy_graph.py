@@ -0,0 +1,275 @@
+import bisect
+import copy
+from collections import OrderedDict
+import numpy as np
+from merge_raw_data import schedule_matrix, NO_TIME
+from metro_graph import TRAIN, TRANSFER, SOURCE_LINE, SOURCE_STATION
+
+ADJACENCY_CACHE_SIZE = 1 << 18 # nodes whose generated out-edges are kept
+
+
+def next_served(served, axis):
+    """Index of the next served entry after every entry along ``axis``, -1 where there is none."""
+    size = served.shape[axis]
+    index = np.where(served, np.arange(size).reshape((-1, 1) if axis == 0 else (1, -1)), size)
+    following = np.flip(np.minimum.accumulate(np.flip(index, axis), axis), axis)
+    shifted = np.full(served.shape, size)
+    if axis == 0:
+        shifted[:-1] = following[1:]
+    else:
+        shifted[:, :-1] = following[:, 1:]
+    return np.where(shifted == size, -1, shifted)
+
+
+class LazyGraph:
+    """
+    Time-expanded graph whose nodes and edges are generated while it is searched.
+
+    Offers the part of the ``MetroGraph`` interface ``coverage_search.a_star``
+    uses. A node is a ``(line, station, minute)`` stop event and gets its
+    ID the first time the search reaches it; its out-edges are generated on
+    request from per-line schedule matrices and per-(line, station) sorted
+    departures, and the adjacency of the last ``cache_size`` nodes is kept.
+    Start-up only indexes the schedule, and memory grows with the part of
+    the day the search touches instead of the whole timetable.
+
+    The generated edges are exactly those ``build_metro_graph`` builds from
+    the same input, in the same order, so a search visits the same states
+    either way. That includes transfers only being linked from lines
+    listed earlier in ``raw_data`` and the reverse transfer edges into the
+    later line.
+
+    ``line``, ``station`` and ``time`` are plain lists that grow as nodes are
+    generated; node IDs depend on the order of the search, so they only
+    mean something for this instance (checkpoints need a ``MetroGraph``).
+
+    Args:
+        raw_data (dict): prepared schedule, ``{line: {"stations", "trainSchedules"}}``
+        transfer_time (dict): transfer walking times, with the reciprocal-direction entries
+        simplify (bool): skip the waiting edges between consecutive trains
+        cache_size (int): nodes whose adjacency is cached
+    """
+
+    def __init__(self, raw_data, transfer_time, simplify=True, cache_size=ADJACENCY_CACHE_SIZE):
+        self.lines = list(raw_data)
+        self.stations = []
+        station_ids = {}
+        self._station_of = []
+        self._columns = []
+        self._times = []
+        self._next_col = []
+        self._next_row = []
+        heads = []
+        for order, line in enumerate(self.lines):
+            stations = raw_data[line]["stations"]
+            for station in stations:
+                if station not in station_ids:
+                    station_ids[station] = len(self.stations)
+                    self.stations.append(station)
+            self._station_of.append([station_ids[station] for station in stations])
+            self._columns.append({station: column for column, station in enumerate(stations)})
+            times = schedule_matrix(line, raw_data[line]["trainSchedules"], len(stations)).astype(np.int32)
+            served = times != NO_TIME
+            self._times.append(times)
+            self._next_col.append(next_served(served, 1))
+            self._next_row.append(None if simplify else next_served(served, 0))
+
+            # trip heads: stop events no train reaches from an earlier station,
+            # in the order the builder creates their nodes (row-major)
+            rows, columns = np.nonzero(served)
+            first = np.concatenate([[True], rows[1:] != rows[:-1]])
+            keys = columns.astype(np.int64) * (1 << 16) + times[rows, columns]
+            _, creation = np.unique(keys, return_index=True)
+            reached = np.unique(keys[~first])
+            creation = creation[~np.isin(keys[creation], reached)]
+            creation.sort()
+            heads.extend((order, column, minute) for column, minute in
+                         zip(columns[creation].tolist(), times[rows[creation], columns[creation]].tolist()))
+        self._heads = heads
+        self._heads_time = np.array([minute for _, _, minute in heads], dtype=np.int32)
+        self._departures = {}
+
+        # transfer rules of every stop: linked to lines listed earlier ("forward",
+        # from this stop) and from lines listed later ("reverse", into this stop)
+        order = {line: i for i, line in enumerate(self.lines)}
+        self._forward = {}
+        self._reverse = {}
+        for line in self.lines:
+            for station, destinations in transfer_time.get(line, {}).items():
+                column = self._columns[order[line]].get(station)
+                if column is None: continue
+                for rank, (dest_line_station, minutes) in enumerate(destinations.items()):
+                    dest_line, dest_station = dest_line_station.rsplit("_", 1)
+                    if order.get(dest_line, len(self.lines)) >= order[line]: continue
+                    dest_column = self._columns[order[dest_line]].get(dest_station)
+                    if dest_column is None: continue
+                    rule = (order[line], column, rank, minutes)
+                    self._forward.setdefault((order[line], column), []).append((order[dest_line], dest_column) + rule[2:])
+                    self._reverse.setdefault((order[dest_line], dest_column), []).append(rule)
+
+        self.cache_size = cache_size
+        self._reset()
+
+    def _reset(self):
+        self.line = []
+        self.station = []
+        self.time = []
+        self._column = []
+        self._nodes = {}
+        self._adjacency = OrderedDict()
+        self.source = None
+        self._source_edges = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.time)
+
+    def number_of_nodes(self):
+        """Nodes generated so far."""
+        return len(self.time)
+
+    def node(self, line, column, minute):
+        """Return the ID of the stop event of line index ``line`` at station column ``column``, generating it."""
+        key = (line, column, minute)
+        u = self._nodes.get(key)
+        if u is None:
+            u = len(self.time)
+            self._nodes[key] = u
+            self.line.append(line)
+            self.station.append(self._station_of[line][column])
+            self.time.append(minute)
+            self._column.append(column)
+        return u
+
+    def node_line(self, u):
+        if u == self.source:
+            return SOURCE_LINE
+        return self.lines[self.line[u]]
+
+    def node_station(self, u):
+        return self.stations[self.station[u]]
+
+    def node_time(self, u):
+        return self.time[u]
+
+    def node_lists(self):
+        """Return the station index and minute lists of the nodes; they grow as the search generates nodes."""
+        return self.station, self.time
+
+    def node_name(self, u):
+        """Return the legacy string ID of ``u``, e.g. ``R_a_R10_512``."""
+        if u == self.source:
+            return f"{SOURCE_LINE}_{SOURCE_STATION}_000"
+        return f"{self.lines[self.line[u]]}_{self.stations[self.station[u]]}_{self.time[u]}"
+
+    def node_id(self, name):
+        """Return the node with legacy string ID ``name``; KeyError if no train stops there then."""
+        if self.source is not None and name == self.node_name(self.source):
+            return self.source
+        line, station, minute = name.rsplit("_", 2)
+        line = self.lines.index(line)
+        column = self._columns[line][station]
+        if int(minute) not in self.departures(line, column)[0]:
+            raise KeyError(name)
+        return self.node(line, column, int(minute))
+
+    def departures(self, line, column):
+        """Sorted stop minutes at a (line, station column) and the train rows in that order, indexed on first use."""
+        key = (line, column)
+        if key not in self._departures:
+            times = self._times[line][:, column]
+            rows = np.flatnonzero(times != NO_TIME)
+            rows = rows[np.argsort(times[rows], kind="stable")]
+            self._departures[key] = (times[rows].tolist(), rows.tolist())
+        return self._departures[key]
+
+    def add_source(self, start=None, end=None):
+        """
+        Return a fresh lazy graph sharing this schedule index, with a super-source.
+
+        Like ``MetroGraph.add_source`` the source links to every trip head
+        departing in ``[start, end)`` with 0-minute TRANSFER edges; here it
+        is node 0, found by its ID rather than its line.
+        """
+        G = copy.copy(self)
+        G._reset()
+        if SOURCE_STATION not in G.stations:
+            G.stations = G.stations + [SOURCE_STATION]
+        G.source = 0
+        G.line.append(-1)
+        G.station.append(G.stations.index(SOURCE_STATION))
+        G.time.append(0)
+        G._column.append(-1)
+        window = np.ones(len(self._heads), dtype=bool)
+        if start is not None:
+            window &= self._heads_time >= start
+        if end is not None:
+            window &= self._heads_time < end
+        G._source_edges = [self._heads[i] for i in np.flatnonzero(window).tolist()]
+        return G, 0
+
+    def out_edges(self, u):
+        """Return ``(successor, time, type)`` tuples for the out-edges of ``u``, generating them on a cache miss."""
+        edges = self._adjacency.get(u)
+        if edges is not None:
+            self.hits += 1
+            self._adjacency.move_to_end(u)
+            return edges
+        self.misses += 1
+        edges = self._generate(u)
+        self._adjacency[u] = edges
+        if len(self._adjacency) > self.cache_size:
+            self._adjacency.popitem(last=False)
+        return edges
+
+    def successors(self, u):
+        return [v for v, _, _ in self.out_edges(u)]
+
+    def _generate(self, u):
+        line, column, minute = self.line[u], self._column[u], self.time[u]
+        if u == self.source:
+            return [(self.node(*head), 0, TRANSFER) for head in self._source_edges]
+
+        # target -> (builder insertion order, type); the builder keeps the
+        # first insertion of an edge, so every target keeps its smallest key
+        targets = {}
+
+        def add(target, key, kind):
+            if target not in targets or key < targets[target][0]:
+                targets[target] = (key, kind)
+
+        times, next_col, next_row = self._times[line], self._next_col[line], self._next_row[line]
+        departures, rows = self.departures(line, column)
+        lo, hi = bisect.bisect_left(departures, minute), bisect.bisect_right(departures, minute)
+        for row in rows[lo:hi]:
+            following = next_col.item(row, column)
+            if following != -1:
+                add((line, following, times.item(row, following)), (line, 0, row, following, 0), TRAIN)
+            if next_row is not None:
+                later = next_row.item(row, column)
+                if later != -1:
+                    add((line, column, times.item(later, column)), (line, 0, later, column, 1), TRANSFER)
+
+        for dest_line, dest_column, rank, minutes in self._forward.get((line, column), ()):
+            dest_departures, _ = self.departures(dest_line, dest_column)
+            k = bisect.bisect_left(dest_departures, minute + minutes)
+            if k < len(dest_departures):
+                add((dest_line, dest_column, dest_departures[k]), (line, 1, column, rank, 0), TRANSFER)
+
+        # reverse edges: this stop event is the last departure at or before
+        # ``arrival - minutes`` for the arrivals in [minute, next departure) + minutes
+        following = departures[hi] if hi < len(departures) else None
+        for other_line, other_column, rank, minutes in self._reverse.get((line, column), ()):
+            arrivals, arrival_rows = self.departures(other_line, other_column)
+            first = bisect.bisect_left(arrivals, minute + minutes)
+            last = bisect.bisect_left(arrivals, following + minutes) if following is not None else len(arrivals)
+            for k in range(first, last):
+                add((other_line, other_column, arrivals[k]), (other_line, 1, other_column, rank, arrival_rows[k]),
+                    TRANSFER)
+
+        edges = []
+        for target, (_, kind) in sorted(targets.items(), key=lambda item: item[1][0]):
+            v = self.node(*target)
+            edges.append((v, target[2] - minute, kind))
+        return edges
@@ -1,26 +1,165 @@
 import os
+import re
 import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 DAYS = "12345"
 # DAYS = "67"
 
-# load every json file in /data 
-def load_json_files():
+NO_TIME = -1 # the trainSchedules null: the train does not serve the station
+SERVICE_DAY_START = 4*60 # times before this were shifted by +24h when scraped (scrape/scrape_html.js)
+SCHEDULE_FILE = re.compile(r"^([A-Za-z]+_[ab])_(\d+)_schedule\.json$")
 
-    data_dir = 'data'
-    raw_data = {}
+Schedule = namedtuple("Schedule", ["stations", "times"])
 
-    for filename in os.listdir(data_dir):
-        if DAYS in filename and "raw" not in filename and filename.endswith('.json'):
-            with open(os.path.join(data_dir, filename), 'r') as f:
-                key = filename.replace('.json', '').replace(DAYS, '').replace('__', '_').replace('_schedule', '')
-                raw_data[key] = json.load(f)
 
-    return raw_data
+def schedule_files(days=DAYS, data_dir='data'):
+    """Return ``{line: path}`` of the schedule files of ``days``, in a stable order."""
+    files = {}
+    for filename in sorted(os.listdir(data_dir)):
+        match = SCHEDULE_FILE.match(filename)
+        if match and match.group(2) == days:
+            files[match.group(1)] = os.path.join(data_dir, filename)
+    return files
 
-def save_raw_data(raw_data, filename=f"working/{DAYS}.json"):
-    with open(filename, 'w') as f:
-        f.write(json.dumps(raw_data, indent=4))
 
-raw_data = load_json_files()
-save_raw_data(raw_data)
\ No newline at end of file
+def schedule_matrix(line, trains, station_count):
+    """Convert ``trainSchedules`` to a trains x stations int16 matrix with ``NO_TIME`` for null."""
+    lengths = {len(train) for train in trains}
+    if lengths - {station_count}:
+        row = next(i for i, train in enumerate(trains) if len(train) != station_count)
+        raise ValueError(f"{line}: train {row} has {len(trains[row])} times for {station_count} stations")
+    times = np.array(trains, dtype=np.float64).reshape(len(trains), station_count)
+    served = ~np.isnan(times)
+    if np.any(times[served] != np.round(times[served])):
+        raise ValueError(f"{line}: schedule contains non-integer minutes")
+    return np.where(served, times, NO_TIME).astype(np.int16)
+
+
+def validate_schedule(line, schedule):
+    """
+    Check a schedule matrix in a few whole-matrix operations.
+
+    Raises ValueError naming the first offending train when a station is
+    listed twice, a time lies outside the service day (an after-midnight
+    time without its +24h shift, or shifted twice), or a train's times
+    decrease along its stations.
+    """
+    stations, times = schedule
+    if len(set(stations)) != len(stations):
+        raise ValueError(f"{line}: stations are not unique")
+    served = times != NO_TIME
+
+    outside = served & ((times < SERVICE_DAY_START) | (times >= SERVICE_DAY_START + 24*60))
+    if outside.any():
+        train, column = np.argwhere(outside)[0]
+        raise ValueError(f"{line}: train {train} has {times[train, column]} at {stations[column]}, "
+                         f"outside the service day starting at {SERVICE_DAY_START}")
+
+    # latest time served so far on every train; a served time below the
+    # latest before it means the train goes back in time
+    latest = np.maximum.accumulate(np.where(served, times, NO_TIME), axis=1)
+    backwards = served[:, 1:] & (times[:, 1:] < latest[:, :-1])
+    if backwards.any():
+        train, column = np.argwhere(backwards)[0]
+        raise ValueError(f"{line}: train {train} arrives at {stations[column + 1]} at {times[train, column + 1]}, "
+                         f"before its earlier time {latest[train, column]}")
+
+
+def load_schedule_file(line, filename):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    schedule = Schedule(data["stations"], schedule_matrix(line, data["trainSchedules"], len(data["stations"])))
+    validate_schedule(line, schedule)
+    return schedule
+
+
+def load_schedules(days=DAYS, data_dir='data', workers=None):
+    """
+    Load and validate every schedule file of ``days`` on a thread pool.
+
+    Returns:
+        dict: ``{line: Schedule(stations, times)}`` with ``times`` a trains x stations int16 matrix
+    """
+    files = schedule_files(days, data_dir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        schedules = pool.map(load_schedule_file, files.keys(), files.values())
+        return dict(zip(files.keys(), schedules))
+
+
+def save_schedules(schedules, filename):
+    """
+    Write schedules as one columnar ``.npz``.
+
+    The line names, the stations of all lines and the flattened time
+    matrices of all lines are each one array; ``station_ptr`` and
+    ``train_ptr`` give every line's slice of them.
+    """
+    lines = list(schedules)
+    station_counts = [len(schedules[line].stations) for line in lines]
+    train_counts = [len(schedules[line].times) for line in lines]
+    with open(filename, 'wb') as f:
+        np.savez(f,
+                 lines=np.array(lines),
+                 stations=np.array([station for line in lines for station in schedules[line].stations]),
+                 station_ptr=np.concatenate([[0], np.cumsum(station_counts)]).astype(np.int32),
+                 train_ptr=np.concatenate([[0], np.cumsum(train_counts)]).astype(np.int32),
+                 times=np.concatenate([schedules[line].times.ravel() for line in lines]).astype(np.int16))
+
+
+def load_merged(filename):
+    """
+    Load schedules from a ``save_schedules`` artifact, or from a legacy merged ``.json``.
+
+    Lines come back in name order, the order of ``schedule_files``, however
+    the file lists them: the graph builder only links transfers to lines
+    before the current one, so the order decides the graph.
+    """
+    if filename.endswith(".json"):
+        with open(filename, 'r') as f:
+            raw_data = json.load(f)
+        schedules = {}
+        for line, data in raw_data.items():
+            schedules[line] = Schedule(data["stations"], schedule_matrix(line, data["trainSchedules"], len(data["stations"])))
+            validate_schedule(line, schedules[line])
+        return dict(sorted(schedules.items()))
+
+    with np.load(filename) as data:
+        station_ptr, train_ptr = data["station_ptr"], data["train_ptr"]
+        stations, times = data["stations"].tolist(), data["times"]
+        schedules = {}
+        offset = 0
+        for i, line in enumerate(data["lines"].tolist()):
+            station_count = station_ptr[i + 1] - station_ptr[i]
+            train_count = train_ptr[i + 1] - train_ptr[i]
+            size = station_count * train_count
+            schedules[line] = Schedule(stations[station_ptr[i]:station_ptr[i + 1]],
+                                       times[offset:offset + size].reshape(train_count, station_count))
+            offset += size
+        return dict(sorted(schedules.items()))
+
+
+def merged_file(days=DAYS, data_dir='working'):
+    """Return the merged schedule of ``days`` in ``data_dir``: the ``.npz`` artifact, else the legacy ``.json``."""
+    filename = os.path.join(data_dir, f"{days}.npz")
+    return filename if os.path.exists(filename) else os.path.join(data_dir, f"{days}.json")
+
+
+def to_raw_data(schedules):
+    """Convert schedules back to the ``{line: {"stations", "trainSchedules"}}`` dict the graph builder reads."""
+    return {line: {
+        "stations": list(schedule.stations),
+        "trainSchedules": [[None if time == NO_TIME else time for time in train] for train in schedule.times.tolist()]
+    } for line, schedule in schedules.items()}
+
+
+def load_raw_data(days=DAYS, data_dir='working'):
+    return to_raw_data(load_merged(merged_file(days, data_dir)))
+
+
+if __name__ == "__main__":
+    schedules = load_schedules()
+    save_schedules(schedules, f"working/{DAYS}.npz")
+    print(f"Merged {len(schedules)} lines, {sum(len(s.times) for s in schedules.values())} trains into working/{DAYS}.npz")
@@ -0,0 +1,459 @@
+import copy
+import json
+import struct
+import numpy as np
+
+TRAIN = 0
+TRANSFER = 1
+
+NO_DEPARTURE = -1
+
+SNAPSHOT_MAGIC = b"TPEGRAPH"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_ALIGN = 64
+SNAPSHOT_ARRAYS = ["line", "station", "time",
+                   "succ_ptr", "succ", "succ_time", "succ_type",
+                   "pred_ptr", "pred", "pred_time", "pred_type"]
+
+SOURCE_LINE = "S_a"
+SOURCE_STATION = "source"
+
+
+class MetroGraph:
+    """
+    Time-expanded metro graph stored as flat arrays.
+
+    Node ``u`` is the stop event of line ``lines[line[u]]`` at station
+    ``stations[station[u]]`` at minute ``time[u]``. Out-edges of ``u`` are
+    ``succ[succ_ptr[u]:succ_ptr[u + 1]]`` with matching ``succ_time`` and
+    ``succ_type`` entries (CSR layout); in-edges use the ``pred_*`` arrays.
+
+    A graph from ``add_source`` also has a super-source, node ``source``
+    (``len(time)``), kept in a small overlay next to the shared arrays.
+    """
+
+    def __init__(self, lines, stations, line, station, time,
+                 succ_ptr, succ, succ_time, succ_type,
+                 pred_ptr=None, pred=None, pred_time=None, pred_type=None):
+        self.lines = list(lines)
+        self.stations = list(stations)
+        self.line = line
+        self.station = station
+        self.time = time
+        self.succ_ptr = succ_ptr
+        self.succ = succ
+        self.succ_time = succ_time
+        self.succ_type = succ_type
+
+        if pred_ptr is None:
+            sources = np.repeat(np.arange(len(time), dtype=np.int32), np.diff(succ_ptr))
+            order = np.argsort(succ, kind="stable")
+            pred_ptr = _csr_pointers(succ[order], len(time))
+            pred = sources[order]
+            pred_time = succ_time[order]
+            pred_type = succ_type[order]
+        self.pred_ptr = pred_ptr
+        self.pred = pred
+        self.pred_time = pred_time
+        self.pred_type = pred_type
+
+        self.source = None
+        self.source_edges = None
+        self._index = None
+        self._heads = None
+
+    def __len__(self):
+        return len(self.time) + (self.source is not None)
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        return len(self.succ) + (len(self.source_edges) if self.source is not None else 0)
+
+    def successors(self, u):
+        if u == self.source:
+            return self.source_edges.tolist()
+        return self.succ[self.succ_ptr[u]:self.succ_ptr[u + 1]].tolist()
+
+    def predecessors(self, u):
+        """Return the predecessors of ``u``, leaving out the source, which has none itself."""
+        if u == self.source:
+            return []
+        return self.pred[self.pred_ptr[u]:self.pred_ptr[u + 1]].tolist()
+
+    def out_edges(self, u):
+        """Return ``(successor, time, type)`` tuples for the out-edges of ``u``."""
+        if u == self.source:
+            return ((v, 0, TRANSFER) for v in self.source_edges.tolist())
+        start, end = self.succ_ptr[u], self.succ_ptr[u + 1]
+        return zip(self.succ[start:end].tolist(),
+                   self.succ_time[start:end].tolist(),
+                   self.succ_type[start:end].tolist())
+
+    def in_edges(self, u):
+        """Return ``(predecessor, time, type)`` tuples for the in-edges of ``u``, leaving out the source's."""
+        if u == self.source:
+            return iter(())
+        start, end = self.pred_ptr[u], self.pred_ptr[u + 1]
+        return zip(self.pred[start:end].tolist(),
+                   self.pred_time[start:end].tolist(),
+                   self.pred_type[start:end].tolist())
+
+    def edge(self, u, v):
+        """Return ``(time, type)`` of the edge ``u -> v``, or None."""
+        for successor, time, kind in self.out_edges(u):
+            if successor == v:
+                return time, kind
+        return None
+
+    def node_line(self, u):
+        if u == self.source:
+            return SOURCE_LINE
+        return self.lines[self.line[u]]
+
+    def node_station(self, u):
+        if u == self.source:
+            return SOURCE_STATION
+        return self.stations[self.station[u]]
+
+    def node_time(self, u):
+        if u == self.source:
+            return 0
+        return int(self.time[u])
+
+    def node_lists(self):
+        """Return the station index and the minute of every node as plain lists, for search loops."""
+        station, time = self.station.tolist(), self.time.tolist()
+        if self.source is not None:
+            station.append(self.stations.index(SOURCE_STATION))
+            time.append(0)
+        return station, time
+
+    def node_name(self, u):
+        """Return the legacy string ID of ``u``, e.g. ``R_a_R10_512``."""
+        if u == self.source:
+            return f"{SOURCE_LINE}_{SOURCE_STATION}_000"
+        return f"{self.lines[self.line[u]]}_{self.stations[self.station[u]]}_{self.time[u]}"
+
+    def node_id(self, name):
+        """Return the node with legacy string ID ``name``."""
+        if self._index is None:
+            self._index = {self.node_name(u): u for u in range(len(self))}
+        return self._index[name]
+
+    def trip_heads(self):
+        """Return the nodes without an incoming TRAIN edge, memoised."""
+        if self._heads is None:
+            has_train = np.zeros(len(self.time), dtype=bool)
+            has_train[self.succ[self.succ_type == TRAIN]] = True
+            self._heads = np.flatnonzero(~has_train).astype(np.int32)
+        return self._heads
+
+    def add_source(self, start=None, end=None):
+        """
+        Return the graph with a super-source linked to every trip head.
+
+        The returned graph shares every array with this one (a mapped
+        snapshot stays shared between processes); the source, node
+        ``len(time)``, and its edges live in an overlay that ``out_edges``
+        checks first. Its edges are TRANSFER edges of time 0; callers weigh
+        the start time themselves. With ``start``/``end`` only trip heads
+        departing in ``[start, end)`` are linked.
+        """
+        heads = self.trip_heads()
+        if start is not None:
+            heads = heads[self.time[heads] >= start]
+        if end is not None:
+            heads = heads[self.time[heads] < end]
+        G = copy.copy(self)
+        if SOURCE_STATION not in G.stations:
+            G.stations = G.stations + [SOURCE_STATION]
+        G.source = len(self.time)
+        G.source_edges = heads
+        G._index = None
+        return G, G.source
+
+    def to_networkx(self):
+        """Convert to a ``networkx.DiGraph`` keyed by legacy string IDs (for debugging/plots)."""
+        import networkx as nx
+
+        G = nx.DiGraph()
+        names = [self.node_name(u) for u in range(len(self))]
+        for u, name in enumerate(names):
+            G.add_node(name, label=self.node_line(u), time=self.node_time(u))
+        for u in range(len(self)):
+            for v, time, kind in self.out_edges(u):
+                G.add_edge(names[u], names[v], type=kind, time=time)
+        return G
+
+
+def _csr_pointers(rows, n):
+    """Return CSR row pointers for the sorted row indices ``rows``."""
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=ptr[1:])
+    return ptr
+
+
+class _GraphBuilder:
+    """Accumulates nodes and edges with the same merge semantics as ``nx.DiGraph``."""
+
+    def __init__(self):
+        self.lines = []
+        self.stations = []
+        self._line_index = {}
+        self._station_index = {}
+        self.nodes = {}
+        self.line = []
+        self.station = []
+        self.time = []
+        self.edges = {}
+
+    def _intern(self, value, values, index):
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def node(self, line, station, time):
+        key = (self._intern(line, self.lines, self._line_index),
+               self._intern(station, self.stations, self._station_index),
+               time)
+        u = self.nodes.get(key)
+        if u is None:
+            u = len(self.time)
+            self.nodes[key] = u
+            self.line.append(key[0])
+            self.station.append(key[1])
+            self.time.append(time)
+        return u
+
+    def edge(self, u, v, time, kind):
+        self.edges[(u, v)] = (time, kind)
+
+    def build(self):
+        n = len(self.time)
+        if self.edges:
+            pairs = np.array(list(self.edges.keys()), dtype=np.int32)
+            attrs = np.array(list(self.edges.values()), dtype=np.int16)
+        else:
+            pairs = np.zeros((0, 2), dtype=np.int32)
+            attrs = np.zeros((0, 2), dtype=np.int16)
+        order = np.argsort(pairs[:, 0], kind="stable")
+        return MetroGraph(
+            self.lines,
+            self.stations,
+            np.array(self.line, dtype=np.uint16),
+            np.array(self.station, dtype=np.uint16),
+            np.array(self.time, dtype=np.int16),
+            _csr_pointers(pairs[order, 0], n),
+            pairs[order, 1].copy(),
+            attrs[order, 0].copy(),
+            attrs[order, 1].astype(np.uint8),
+        )
+
+
+class DepartureIndex:
+    """
+    Sorted departure minutes of every (line, station), built once from the schedule.
+
+    Transfer edges only ever need "the first train leaving at or after t" and
+    "the last train leaving at or before t", so both are answered with a
+    binary search instead of a scan over every train of the destination line.
+    """
+
+    def __init__(self, raw_data):
+        self.departures = {}
+        for line in raw_data:
+            schedule = raw_data[line]["trainSchedules"]
+            for index, station in enumerate(raw_data[line]["stations"]):
+                times = [train[index] for train in schedule if train[index] is not None]
+                self.departures[(line, station)] = np.sort(np.array(times, dtype=np.int16))
+
+    def connections(self, line, station, arrivals, transfer):
+        """
+        Match arrivals elsewhere against the departures of ``line`` at ``station``.
+
+        Args:
+            line (str): destination line, e.g. ``BL_a``
+            station (str): destination station, e.g. ``BL12``
+            arrivals (list): arrival minutes on the origin line
+            transfer (int): walking time between the two platforms
+
+        Returns:
+            tuple: ``(forward, reverse)`` arrays aligned with ``arrivals``;
+            ``forward`` is the first departure at or after ``arrival + transfer``
+            and ``reverse`` the last departure at or before ``arrival - transfer``,
+            ``NO_DEPARTURE`` where there is none
+        """
+        departures = self.departures[(line, station)]
+        arrivals = np.asarray(arrivals, dtype=np.int32)
+        if len(departures) == 0:
+            none = np.full(len(arrivals), NO_DEPARTURE, dtype=np.int32)
+            return none, none.copy()
+
+        after = np.searchsorted(departures, arrivals + transfer, side="left")
+        forward = np.where(after < len(departures),
+                           departures[np.minimum(after, len(departures) - 1)], NO_DEPARTURE)
+        before = np.searchsorted(departures, arrivals - transfer, side="right") - 1
+        reverse = np.where(before >= 0, departures[np.maximum(before, 0)], NO_DEPARTURE)
+        return forward, reverse
+
+
+def build_metro_graph(raw_data, transfer_time, simplify=True):
+    """
+    Build the time-expanded graph straight from the raw schedule dict.
+
+    Args:
+        raw_data (dict): ``{line: {"stations": [...], "trainSchedules": [[...]]}}``
+        transfer_time (dict): ``{line: {station: {dest_line_station: minutes}}}``,
+            already extended with the reciprocal-direction entries
+        simplify (bool): skip the waiting edges between consecutive trains
+
+    Returns:
+        MetroGraph: the graph
+    """
+    builder = _GraphBuilder()
+    departure_index = DepartureIndex(raw_data)
+
+    recorded_stations = set()
+    for line in raw_data:
+        stations = raw_data[line]["stations"]
+        prev_train = [None] * len(stations)
+        for train in raw_data[line]["trainSchedules"]:
+            train_head = None
+            for index, time in enumerate(train):
+                if time is None: continue
+                current_node = builder.node(line, stations[index], time)
+
+                if train_head is not None:
+                    builder.edge(train_head, current_node, time - builder.time[train_head], TRAIN)
+                if prev_train[index] is not None and not simplify:
+                    builder.edge(prev_train[index], current_node, time - builder.time[prev_train[index]], TRANSFER)
+
+                train_head = current_node
+                prev_train[index] = current_node
+
+        # transfer
+        for index, station in enumerate(stations):
+            for dest_line_station, time in transfer_time.get(line, {}).get(station, {}).items():
+                if dest_line_station not in recorded_stations: continue
+                dest_line, dest_station = dest_line_station.rsplit("_", 1)
+                arrivals = [train[index] for train in raw_data[line]["trainSchedules"] if train[index] is not None]
+                forward, reverse = departure_index.connections(dest_line, dest_station, arrivals, time)
+
+                for arrival, departure, reverse_departure in zip(arrivals, forward.tolist(), reverse.tolist()):
+                    arrival_node = builder.node(line, station, arrival)
+                    if departure != NO_DEPARTURE:
+                        builder.edge(arrival_node, builder.node(dest_line, dest_station, departure),
+                                     departure - arrival, TRANSFER)
+                    if reverse_departure != NO_DEPARTURE:
+                        builder.edge(builder.node(dest_line, dest_station, reverse_departure), arrival_node,
+                                     arrival - reverse_departure, TRANSFER)
+
+        recorded_stations.update(f"{line}_{station}" for station in stations)
+
+    return builder.build()
+
+
+def graph_to_json(G):
+    """Export a MetroGraph to the node/edge JSON layout used in ``working/``."""
+    graph_data = {
+        "nodes": [],
+        "edges": []
+    }
+
+    names = [G.node_name(u) for u in range(len(G))]
+    for u, name in enumerate(names):
+        graph_data["nodes"].append({
+            "id": name,
+            "label": G.node_line(u),
+            "time": G.node_time(u)
+        })
+
+    for u, name in enumerate(names):
+        for v, time, kind in G.out_edges(u):
+            graph_data["edges"].append({
+                "source": name,
+                "target": names[v],
+                "type": kind,
+                "time": time
+            })
+
+    return graph_data
+
+
+def json_to_graph(graph_data):
+    """
+    Convert a JSON graph representation back to a MetroGraph.
+
+    Args:
+        graph_data (dict): Dictionary containing nodes and edges data
+
+    Returns:
+        MetroGraph: the graph, with node IDs in file order
+    """
+    builder = _GraphBuilder()
+    ids = {}
+    for node_data in graph_data["nodes"]:
+        line_dir, station, _ = node_data["id"].rsplit("_", 2)
+        ids[node_data["id"]] = builder.node(line_dir, station, node_data.get("time", 0))
+
+    for edge_data in graph_data["edges"]:
+        builder.edge(ids[edge_data["source"]], ids[edge_data["target"]],
+                     edge_data.get("time", 0), edge_data.get("type", TRAIN))
+
+    return builder.build()
+
+
+def save_snapshot(G, filename):
+    """
+    Write a MetroGraph to a versioned binary snapshot.
+
+    Layout: magic, version and header length, a small JSON header (line and
+    station names plus dtype/length/offset of every array), then the raw
+    node and CSR arrays, each aligned to ``SNAPSHOT_ALIGN`` bytes.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(G, name)) for name in SNAPSHOT_ARRAYS}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, len(array), offset]
+        offset += -(-array.nbytes // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+    header = json.dumps({"lines": G.lines, "stations": G.stations, "arrays": layout}).encode("utf-8")
+
+    prefix = struct.pack("<8sII", SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)) + header
+    data_start = -(-len(prefix) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+    with open(filename, "wb") as f:
+        f.write(prefix)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name][2])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_snapshot(filename):
+    """
+    Memory-map a snapshot written by ``save_snapshot``.
+
+    The arrays of the returned MetroGraph are read-only views into the
+    mapping, so nothing is parsed or copied and processes loading the same
+    file share the page cache.
+    """
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    magic, version, header_length = struct.unpack_from("<8sII", data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{filename} is not a metro graph snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"{filename} has snapshot version {version}, expected {SNAPSHOT_VERSION}")
+
+    header_start = struct.calcsize("<8sII")
+    header = json.loads(bytes(data[header_start:header_start + header_length]).decode("utf-8"))
+    data_start = -(-(header_start + header_length) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+    arrays = {}
+    for name, (dtype, length, offset) in header["arrays"].items():
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=length, offset=data_start + offset)
+    return MetroGraph(header["lines"], header["stations"], **arrays)
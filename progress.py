@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+FLUSH_INTERVAL = 0.2 # seconds between flushes of rate-limited writes, busy or not
+
+
+def write_json_atomic(filename, data):
+    """Write ``data`` as indented JSON to a temporary name and rename it over ``filename``."""
+    temp = f"{filename}.tmp"
+    with open(temp, "w") as f:
+        f.write(json.dumps(data, indent=4))
+    os.replace(temp, filename)
+
+
+class ProgressSink:
+    """Backend of a ProgressPublisher; all methods run on the publisher thread."""
+
+    def write(self, event):
+        pass
+
+    def flush(self, force=False):
+        pass
+
+    def close(self):
+        self.flush(force=True)
+
+
+class JsonlSink(ProgressSink):
+    """Append every event as one JSON line, e.g. for later replay or rendering."""
+
+    def __init__(self, filename):
+        self.file = open(filename, "a")
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+    def flush(self, force=False):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class AtomicFileSink(ProgressSink):
+    """
+    Keep ``filename`` holding the latest path, written at most every ``min_interval`` seconds.
+
+    The file is written to a temporary name and renamed over the target, so
+    readers such as visualization.py never see a half-written file.
+    """
+
+    def __init__(self, filename, min_interval=1.0, events=("improved", "sample", "finished")):
+        self.filename = filename
+        self.min_interval = min_interval
+        self.events = events
+        self.pending = None
+        self.last_write = 0
+
+    def write(self, event):
+        if event["event"] in self.events:
+            self.pending = event["path"]
+            self.flush(force=event["event"] == "finished")
+
+    def flush(self, force=False):
+        if self.pending is None: return
+        if not force and time.monotonic() - self.last_write < self.min_interval: return
+        write_json_atomic(self.filename, self.pending)
+        self.pending = None
+        self.last_write = time.monotonic()
+
+
+class ConsoleSink(ProgressSink):
+    """Print progress lines the way the solvers used to: ``[coverage] A->B->C: score``."""
+
+    def write(self, event):
+        if event["event"] == "progress":
+            print(f"[{event['coverage']}] " + '->'.join([n.split('_')[2] for n in event["path"]]) + ": " + str(event["score"]))
+            print(f"frontier {event['frontier']}, labels {event['labels']}")
+
+
+class SocketSink(ProgressSink):
+    """Publish every event as a JSON datagram to a local UDP port; missing listeners are fine."""
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write(self, event):
+        try:
+            self.socket.sendto(json.dumps(event).encode("utf-8"), self.address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.socket.close()
+
+
+class QueueSink(ProgressSink):
+    """Hand every event to a queue, e.g. a ``multiprocessing.Queue`` read by another process."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def write(self, event):
+        self.target.put(event)
+
+
+class ProgressPublisher:
+    """
+    Collects search events without blocking and fans them out to sinks on a background thread.
+
+    The search only calls ``publish``, which puts the event on an in-memory
+    queue. Paths are published as node IDs and converted to their string
+    names with ``node_name`` on the publisher thread. Sinks are flushed
+    every ``FLUSH_INTERVAL`` seconds however busy the queue is, so a held
+    back path is written even while other events keep arriving. A sink
+    that raises is reported, kept in ``errors`` and dropped; the other
+    sinks keep receiving events.
+
+    Args:
+        sinks (list): ProgressSink backends
+        node_name (callable): node ID -> legacy string name, e.g. ``G.node_name``
+    """
+
+    def __init__(self, sinks, node_name=str):
+        self.sinks = list(sinks)
+        self.node_name = node_name
+        self.errors = []
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def publish(self, event, **fields):
+        fields["event"] = event
+        fields["time"] = time.time()
+        self.queue.put(fields)
+
+    def close(self):
+        """Deliver everything published so far and close the sinks."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _deliver(self, method, *args):
+        """Call ``method`` on every sink, dropping the sinks that raise."""
+        for sink in list(self.sinks):
+            try:
+                getattr(sink, method)(*args)
+            except Exception as e:
+                print(f"Progress sink {type(sink).__name__} failed in {method}: {e!r}; dropping it")
+                self.errors.append((sink, e))
+                self.sinks.remove(sink)
+
+    def _run(self):
+        next_flush = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            try:
+                event = self.queue.get(timeout=max(next_flush - time.monotonic(), 0))
+            except queue.Empty:
+                event = False
+            if event is None:
+                break
+            if event:
+                if "path" in event:
+                    event["path"] = [self.node_name(n) for n in event["path"]]
+                self._deliver("write", event)
+            if time.monotonic() >= next_flush:
+                self._deliver("flush")
+                next_flush = time.monotonic() + FLUSH_INTERVAL
+        self._deliver("close")
@@ -0,0 +1,145 @@
+import time
+import numpy as np
+from metro_graph import MetroGraph
+from graph_builder import build_graph, source_graph
+from coverage_search import a_star, SearchOptions
+from heuristics import build_heuristic
+
+DAYS = "12345"
+SIMPLIFY = False # every station keeps its transfer nodes, so station pairs can change anywhere
+ORIGIN = "R28"
+DESTINATION = "BL23"
+WINDOW_START = 6*60
+WINDOW_END = 10*60
+
+COVERAGE = False # profile the full coverage search instead of the station pair
+HEURISTIC = None # admissible lower bound from heuristics.HEURISTICS for the coverage profile
+MAX_EXPANSIONS = 500000
+
+INFINITY = 1 << 30
+
+
+def arrival_sweep(G: MetroGraph, destination):
+    """
+    Earliest arrival at station ``destination`` from every node of the graph, in one sweep.
+
+    Every edge of the time-expanded graph goes forward in time or stays at
+    the same minute, so visiting the nodes from the latest minute back
+    settles each node from its already settled successors: the sweep
+    answers every departure of the day at once instead of searching from
+    each one. Nodes of one minute are relaxed until they agree, since
+    0-minute transfers can link them both ways.
+
+    Returns:
+        tuple: ``(arrival, next)`` lists indexed by node; ``next[node]`` is
+        the successor on the earliest path, -1 at the destination or when
+        it is unreachable (arrival ``INFINITY``)
+    """
+    target = G.stations.index(destination)
+    arrival = np.where(G.station == target, G.time.astype(np.int64), INFINITY).tolist()
+    following = [-1] * len(G)
+
+    # drop the few wait edges that go back in time (trains listed out of
+    # order in the schedule); no journey can take them
+    tail = np.repeat(np.arange(len(G)), np.diff(G.succ_ptr))
+    forward = G.time[G.succ] >= G.time[tail]
+    succ_ptr = np.concatenate([[0], np.cumsum(np.bincount(tail[forward], minlength=len(G)))]).tolist()
+    succ = G.succ[forward].tolist()
+
+    order = np.argsort(-G.time.astype(np.int64), kind="stable")
+    minutes = G.time[order]
+    bounds = np.flatnonzero(np.diff(minutes)) + 1
+    for group in np.split(order, bounds):
+        group = group.tolist()
+        changed = True
+        while changed:
+            changed = False
+            for node in group:
+                best = arrival[node]
+                for k in range(succ_ptr[node], succ_ptr[node + 1]):
+                    successor = succ[k]
+                    if arrival[successor] < best:
+                        best = arrival[successor]
+                        following[node] = successor
+                if best < arrival[node]:
+                    arrival[node] = best
+                    changed = True
+    return arrival, following
+
+
+def pareto_front(points):
+    """Keep the ``(departure, arrival, ...)`` points no later departure arrives as early as, earliest first."""
+    front = []
+    best = INFINITY
+    for point in sorted(points, key=lambda point: (-point[0], point[1])):
+        if point[1] < best:
+            front.append(point)
+            best = point[1]
+    front.reverse()
+    return front
+
+
+def station_profile(G: MetroGraph, origin, destination, start, end):
+    """
+    Pareto front of ``(departure, arrival)`` from ``origin`` to ``destination`` over ``[start, end]``.
+
+    Returns:
+        list: ``(departure, arrival, path)`` tuples, earliest departure
+        first; ``path`` holds the node IDs of the journey
+    """
+    arrival, following = arrival_sweep(G, destination)
+    source = G.stations.index(origin)
+    departures = np.flatnonzero((G.station == source) & (G.time >= start) & (G.time <= end)).tolist()
+    front = pareto_front([(G.node_time(node), arrival[node], node) for node in departures
+                          if arrival[node] < INFINITY])
+
+    profile = []
+    for departure, arrival_time, node in front:
+        path = [node]
+        while following[path[-1]] != -1:
+            path.append(following[path[-1]])
+        profile.append((departure, arrival_time, [G.node_name(n) for n in path]))
+    return profile
+
+
+def coverage_profile(built, start, end, every_stop=False, heuristic=None, max_expansions=None, progress=None):
+    """
+    Pareto front of ``(start, finish)`` of the coverage search over trip starts in ``[start, end)``.
+
+    One ``a_star`` profile search from a super-source linked to every trip
+    start of the window, instead of one search per start.
+
+    Returns:
+        list: ``(start, finish, path)`` tuples, earliest start first; ``path``
+        holds node IDs
+    """
+    G, source, stations_index = source_graph(built, start, end)
+    if isinstance(heuristic, str):
+        heuristic = build_heuristic(heuristic, built.raw_data, built.transfer_time, stations_index)
+    front = a_star(G, source, stations_index, every_stop=every_stop, segments=built.segments, heuristic=heuristic,
+                   options=SearchOptions(progress=progress, max_expansions=max_expansions, profile=True))
+    return [(first, finish, [G.node_name(n) for n in path[1:]]) for first, finish, path in front]
+
+
+def clock(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def main():
+    built = build_graph(DAYS, simplify=SIMPLIFY)
+    start = time.perf_counter()
+    if COVERAGE:
+        front = coverage_profile(built, WINDOW_START, WINDOW_END, heuristic=HEURISTIC, max_expansions=MAX_EXPANSIONS)
+        title = "Full coverage"
+    else:
+        front = station_profile(built.graph, ORIGIN, DESTINATION, WINDOW_START, WINDOW_END)
+        title = f"{ORIGIN} -> {DESTINATION}"
+    elapsed = time.perf_counter() - start
+    for departure, arrival, path in front:
+        print(f"{clock(departure)} -> {clock(arrival)} ({arrival - departure} min, {len(path)} nodes)")
+    print(f"{title}: {len(front)} Pareto-optimal departures between {clock(WINDOW_START)} and {clock(WINDOW_END)} "
+          f"in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
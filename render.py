@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from PIL import Image
+import visualization
+from merge_raw_data import load_raw_data
+
+DAYS = "12345"
+HISTORY = "working/progress.jsonl" # JSONL event stream from progress.JsonlSink, or a best_path.json list
+FRAMES_DIR = "output/frames"
+VIDEO = "output/best_path.gif" # .gif or .mp4 (needs ffmpeg), None to keep only the PNG frames
+FPS = 4
+DPI = 100
+WORKERS = None # defaults to os.cpu_count()
+
+# per-process renderer, created by init_worker
+_renderer = {}
+
+
+def load_history(filename, events=("improved", "finished")):
+    """
+    Load the paths to render from a solver run.
+
+    Args:
+        filename (str): JSONL event stream, or a JSON file holding a single path
+        events (tuple): event types of the stream that become frames
+
+    Returns:
+        list: ``(label, path)`` tuples, one per frame
+    """
+    with open(filename, 'r') as f:
+        content = f.read()
+
+    if content.lstrip().startswith("["):
+        path = json.loads(content)
+        return [(f"{len(path)} stops", path)]
+
+    frames = []
+    for line in content.splitlines():
+        if not line.strip(): continue
+        event = json.loads(line)
+        if event.get("event") in events and "path" in event:
+            frames.append((f"{event['event']} #{event.get('expansions', '')}: coverage {event.get('coverage', '')}",
+                           event["path"]))
+    return frames
+
+
+def line_lanes(raw_data):
+    """
+    Return fixed y-coordinates for time-space plots, ``{line: {station: y}}``.
+
+    Every line direction gets its own lane of height 1 and its stations are
+    spread over the lane in schedule order, so no layout has to be computed.
+    """
+    lanes = {}
+    for lane, line in enumerate(sorted(raw_data)):
+        stations = raw_data[line]["stations"]
+        lanes[line] = {station: lane + 0.8 * index / max(len(stations) - 1, 1)
+                       for index, station in enumerate(stations)}
+    return lanes
+
+
+def lane_position(node_id, lanes):
+    """Return ``(minute, y)`` of a node ID in the lane layout, or None for the super-source."""
+    line_dir, station, time = node_id.rsplit("_", 2)
+    if line_dir not in lanes or station not in lanes[line_dir]:
+        return None
+    return int(time), lanes[line_dir][station]
+
+
+class FrameRenderer:
+    """
+    Render best-path frames with the Agg backend.
+
+    The geographic map and the time-lane chart are drawn once; every frame
+    only replaces the data of the path overlay before saving the figure.
+    """
+
+    def __init__(self, raw_data, dpi=DPI):
+        self.dpi = dpi
+        self.lanes = line_lanes(raw_data)
+        stations = visualization.get_all_stations(raw_data)
+        _, self.pos = visualization.create_network_layout(stations)
+
+        self.fig = plt.figure(figsize=(16, 9))
+        self.map_ax = self.fig.add_axes([0.0, 0.05, 0.42, 0.85])
+        visualization.draw_network(self.map_ax, stations, self.pos)
+
+        self.lane_ax = self.fig.add_axes([0.56, 0.08, 0.42, 0.82])
+        for line, stations_y in self.lanes.items():
+            ys = list(stations_y.values())
+            self.lane_ax.hlines(ys, 5*60, 25*60, colors=visualization.LINE_COLORS.get(line.split("_")[0], "grey"),
+                                linewidth=0.3, alpha=0.5)
+        self.lane_ax.set_yticks([min(s.values()) + 0.4 for s in self.lanes.values()])
+        self.lane_ax.set_yticklabels(list(self.lanes.keys()), fontsize=7)
+        self.lane_ax.set_xlim(5*60, 25*60)
+        self.lane_ax.set_xticks(range(5*60, 25*60 + 1, 120))
+        self.lane_ax.set_xticklabels([f"{t // 60:02d}:00" for t in range(5*60, 25*60 + 1, 120)])
+        self.lane_ax.set_title("Path over time")
+
+        self.path_line, = self.map_ax.plot([], [], color='red', linestyle='--', linewidth=2.5, zorder=3)
+        self.path_nodes = self.map_ax.scatter([], [], s=80, c='red', zorder=4)
+        self.lane_line, = self.lane_ax.plot([], [], color='red', linewidth=1.5, marker='o', markersize=2)
+        self.label = self.fig.text(0.5, 0.96, "", ha="center", fontsize=14)
+
+    def render(self, label, path, filename):
+        xy, highlighted, _ = visualization.path_overlay_data(path, self.pos)
+        self.path_line.set_data(xy[:, 0], xy[:, 1])
+        self.path_nodes.set_offsets(highlighted)
+
+        points = [p for p in (lane_position(node_id, self.lanes) for node_id in path) if p is not None]
+        self.lane_line.set_data([p[0] for p in points], [p[1] for p in points])
+        self.label.set_text(label)
+        self.fig.savefig(filename, dpi=self.dpi)
+        return filename
+
+
+def init_worker(raw_data, dpi):
+    _renderer["renderer"] = FrameRenderer(raw_data, dpi)
+
+
+def render_frame(job):
+    index, label, path, frames_dir = job
+    return _renderer["renderer"].render(label, path, os.path.join(frames_dir, f"frame_{index:05d}.png"))
+
+
+def render_frames(raw_data, frames, frames_dir, dpi=DPI, workers=None):
+    """Render ``(label, path)`` frames to numbered PNGs in parallel worker processes."""
+    os.makedirs(frames_dir, exist_ok=True)
+    jobs = [(index, label, path, frames_dir) for index, (label, path) in enumerate(frames)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(raw_data, dpi)) as pool:
+        return list(pool.map(render_frame, jobs))
+
+
+def write_video(filenames, output, fps=FPS):
+    """Assemble rendered frames into a GIF (Pillow) or an MP4 (ffmpeg)."""
+    if output.endswith(".gif"):
+        images = [Image.open(filename) for filename in filenames]
+        images[0].save(output, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+        return
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to write MP4 output")
+    pattern = os.path.join(os.path.dirname(filenames[0]), "frame_%05d.png")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-framerate", str(fps), "-i", pattern,
+                    "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", output], check=True)
+
+
+def main():
+    raw_data = load_raw_data(DAYS)
+
+    frames = load_history(HISTORY)
+    if not frames:
+        print(f"No paths to render in {HISTORY}")
+        return
+
+    filenames = render_frames(raw_data, frames, FRAMES_DIR, DPI, WORKERS)
+    print(f"Rendered {len(filenames)} frames to {FRAMES_DIR}")
+    if VIDEO:
+        write_video(filenames, VIDEO, FPS)
+        print(f"Saved {VIDEO}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import asyncio
+import itertools
+import json
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+from metro_graph import load_snapshot
+from graph_builder import build_graph, source_graph
+from coverage_search import a_star, path_summary, SearchOptions
+from heuristics import build_heuristic, HEURISTICS
+from journey import ConnectionScan
+from progress import ProgressPublisher, QueueSink
+
+DAYS = "12345"
+SIMPLIFY = True
+SUPPRESS = False
+TEST_DATA = False
+HOST = "127.0.0.1"
+PORT = 8080
+WORKERS = 2 # processes for coverage searches
+CACHE_SIZE = 1024 # cached route results and coverage runs
+MAX_EXPANSIONS = 200000 # default per coverage run
+PROGRESS_EVERY = 10000 # pops between progress events of a coverage run
+MAX_WAIT = 30 # seconds a /best request may wait for a newer path
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               500: "Internal Server Error"}
+
+# per-process search context, filled by init_worker
+_worker = {}
+
+
+def param(params, name, kind=int, default=None):
+    """
+    Return request parameter ``name`` as a ``kind`` (int, float or str).
+
+    Query-string values arrive as strings and JSON body values with their
+    own type (a JSON null counts as missing); anything else, a missing
+    parameter without ``default`` or a string that does not parse raises
+    ValueError, answered with a 400.
+    """
+    if params.get(name) is None:
+        if default is None:
+            raise ValueError(f"missing parameter '{name}'")
+        return default
+    value = params[name]
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(f"parameter '{name}' must be a string, got {value!r}")
+        return value
+    allowed = (str, int) if kind is int else (str, int, float)
+    if isinstance(value, bool) or not isinstance(value, allowed):
+        raise ValueError(f"parameter '{name}' must be {'an integer' if kind is int else 'a number'}, got {value!r}")
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"parameter '{name}' must be {'an integer' if kind is int else 'a number'}, got {value!r}")
+
+
+class LRUCache:
+    """Keep the ``size`` most recently used results."""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.items:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class RunEvents:
+    """Queue adapter for ``QueueSink`` tagging every progress event with its run ID."""
+
+    def __init__(self, target, run):
+        self.target = target
+        self.run = run
+
+    def put(self, event):
+        self.target.put((self.run, event))
+
+
+def init_worker(built, events):
+    """Map the shared graph snapshot once per worker process."""
+    _worker["built"] = built._replace(graph=load_snapshot(built.snapshot))
+    _worker["events"] = events
+    _worker["heuristics"] = {}
+
+
+def run_coverage(run, start, end, options):
+    """Coverage search over the trips starting in ``[start, end)``, publishing progress to the service."""
+    built = _worker["built"]
+    G, source, stations_index = source_graph(built, start, end)
+    heuristic = None
+    if options["heuristic"]:
+        if options["heuristic"] not in _worker["heuristics"]:
+            _worker["heuristics"][options["heuristic"]] = build_heuristic(
+                options["heuristic"], built.raw_data, built.transfer_time, stations_index)
+        heuristic = _worker["heuristics"][options["heuristic"]]
+    sink = QueueSink(RunEvents(_worker["events"], run))
+    with ProgressPublisher([sink], G.node_name) as progress:
+        path = a_star(G, source, stations_index, every_stop=options["every_stop"], segments=built.segments,
+                      heuristic=heuristic, options=SearchOptions(progress=progress, progress_every=PROGRESS_EVERY,
+                                                                 max_expansions=options["max_expansions"]))
+    coverage, minutes = path_summary(G, path, stations_index)
+    return {"coverage": coverage, "minutes": minutes, "path": [G.node_name(n) for n in path]}
+
+
+class RouteService:
+    """
+    HTTP/JSON front end to a graph and journey planner loaded once.
+
+    Routes are answered on the event loop from the in-memory Connection
+    Scan planner. Coverage searches run in a process pool whose workers map
+    the graph snapshot; their progress events come back over a queue and
+    update the run states and the best path, which clients long-poll with
+    ``/best`` instead of polling best_path.json. Identical route queries
+    and coverage runs are served from an LRU cache.
+
+    Endpoints:
+        GET /: graph size, runs and cache statistics
+        GET /route?from=R28&to=BL23&departure=480: earliest-arrival journey
+        POST /coverage?start=360&end=370[&heuristic=&max_expansions=&every_stop=]: start
+            (or reuse) a coverage run
+        GET /coverage: all runs; GET /coverage/<run>: one run with its latest path
+        GET /best[?since=<version>&wait=<seconds>]: the best published path (most stations,
+            then fewest minutes), waiting for one newer than ``since``
+    """
+
+    def __init__(self, days=DAYS, simplify=SIMPLIFY, suppress=SUPPRESS, test_data=TEST_DATA,
+                 workers=WORKERS, cache_size=CACHE_SIZE):
+        self.built = build_graph(days, simplify=simplify, suppress=suppress, test_data=test_data)
+        self.planner = ConnectionScan.from_days(days)
+        self.cache = LRUCache(cache_size)
+        self.runs = {}
+        self.run_ids = itertools.count(1)
+        self.best = {"version": 0, "run": None, "coverage": 0, "minutes": None, "path": []}
+        self.changed = None
+        self.events = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                        initargs=(self.built._replace(graph=None), self.events))
+        self.loop = None
+
+    async def serve(self, host=HOST, port=PORT):
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+        drain = threading.Thread(target=self._drain, daemon=True)
+        drain.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving {self.built.graph.number_of_nodes()} nodes on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.events.put(None)
+            self.pool.shutdown(cancel_futures=True)
+
+    def _drain(self):
+        """Move progress events from the worker queue onto the event loop."""
+        while True:
+            item = self.events.get()
+            if item is None:
+                break
+            self.loop.call_soon_threadsafe(self.on_event, *item)
+
+    def on_event(self, run, event):
+        state = self.runs[run]
+        # the queue may still hold events of a run ``on_done`` has completed
+        if state["status"] in ("finished", "failed"):
+            return
+        if state["status"] == "queued":
+            state["status"] = "running"
+        for field in ("coverage", "score", "expansions", "frontier"):
+            if field in event:
+                state[field] = event[field]
+        if "path" in event and event["event"] in ("improved", "finished", "progress"):
+            state["path"] = event["path"]
+        if event["event"] in ("improved", "finished"):
+            self.publish_best(run, event["coverage"], round(event["elapsed"]), event["path"])
+
+    def publish_best(self, run, coverage, minutes, path):
+        """Publish ``path`` if it covers more stations than the best path, or as many in fewer minutes."""
+        best = self.best
+        if best["run"] is not None and (coverage, -minutes) <= (best["coverage"], -best["minutes"]):
+            return
+        self.best = {"version": best["version"] + 1, "run": run, "coverage": coverage, "minutes": minutes,
+                     "path": path}
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def handle(self, reader, writer):
+        try:
+            status, body = await self.respond(reader)
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": repr(e)}
+        payload = json.dumps(body).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, reader):
+        request = (await reader.readline()).decode("latin-1").split()
+        if len(request) != 3:
+            raise ValueError("malformed request line")
+        method, target, _ = request
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line: break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        body = await reader.readexactly(length) if length else b""
+
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        if body:
+            try:
+                fields = json.loads(body)
+            except ValueError as e:
+                raise ValueError(f"request body is not valid JSON: {e}")
+            if not isinstance(fields, dict):
+                raise ValueError("request body must be a JSON object")
+            params.update(fields)
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == [] and method == "GET":
+            return 200, self.status()
+        if parts == ["route"] and method == "GET":
+            return 200, self.route(params)
+        if parts == ["coverage"] and method == "POST":
+            return 202, self.start_coverage(params)
+        if parts == ["coverage"] and method == "GET":
+            return 200, [{k: v for k, v in state.items() if k != "path"} for state in self.runs.values()]
+        if len(parts) == 2 and parts[0] == "coverage" and method == "GET":
+            run = self.runs.get(int(parts[1]) if parts[1].isdigit() else None)
+            return (200, run) if run is not None else (404, {"error": f"no run {parts[1]}"})
+        if parts == ["best"] and method == "GET":
+            return 200, await self.wait_best(param(params, "since", default=-1), param(params, "wait", float, 0.0))
+        if parts and parts[0] in ("route", "coverage", "best"):
+            return 405, {"error": f"{method} not allowed on {url.path}"}
+        return 404, {"error": f"no endpoint {url.path}"}
+
+    def status(self):
+        return {
+            "graph": self.built.snapshot,
+            "nodes": self.built.graph.number_of_nodes(),
+            "edges": self.built.graph.number_of_edges(),
+            "runs": {status: sum(state["status"] == status for state in self.runs.values())
+                     for status in ("queued", "running", "finished", "failed")},
+            "cache": {"size": len(self.cache.items), "hits": self.cache.hits, "misses": self.cache.misses},
+            "best": self.best["version"]
+        }
+
+    def route(self, params):
+        origin, destination, departure = param(params, "from", str), param(params, "to", str), param(params, "departure")
+        for station in (origin, destination):
+            if station not in self.planner.station_stops:
+                raise ValueError(f"unknown station {station}")
+        key = ("route", origin, destination, departure)
+        result = self.cache.get(key)
+        if result is None:
+            arrival, path = self.planner.query(origin, destination, departure)
+            result = {"from": origin, "to": destination, "departure": departure, "arrival": arrival, "path": path}
+            self.cache.put(key, result)
+        return result
+
+    def start_coverage(self, params):
+        start, end = param(params, "start"), param(params, "end")
+        if start >= end:
+            raise ValueError(f"start {start} must be before end {end}")
+        options = {
+            "heuristic": param(params, "heuristic", str, "") or None,
+            "max_expansions": param(params, "max_expansions", default=MAX_EXPANSIONS),
+            "every_stop": str(params.get("every_stop", "")).lower() in ("1", "true")
+        }
+        if options["heuristic"] is not None and options["heuristic"] not in HEURISTICS:
+            raise ValueError(f"unknown heuristic {options['heuristic']}, expected one of {HEURISTICS}")
+        key = ("coverage", start, end, options["heuristic"], options["max_expansions"], options["every_stop"])
+        run = self.cache.get(key)
+        if run is not None and self.runs[run]["status"] != "failed":
+            return self.runs[run]
+
+        run = next(self.run_ids)
+        self.runs[run] = {"run": run, "status": "queued", "start": start, "end": end, "options": options,
+                          "submitted": time.time(), "coverage": 0, "path": []}
+        self.cache.put(key, run)
+        future = self.loop.run_in_executor(self.pool, run_coverage, run, start, end, options)
+        future.add_done_callback(lambda future: self.on_done(run, future))
+        return self.runs[run]
+
+    def on_done(self, run, future):
+        state = self.runs[run]
+        state["finished"] = time.time()
+        if future.exception() is not None:
+            state["status"] = "failed"
+            state["error"] = repr(future.exception())
+            return
+        state["status"] = "finished"
+        state.update(future.result())
+        self.publish_best(run, state["coverage"], state["minutes"], state["path"])
+
+    async def wait_best(self, since, wait):
+        """Return the best path once its version is newer than ``since``, or after ``wait`` seconds."""
+        if self.best["version"] <= since and wait > 0:
+            try:
+                await asyncio.wait_for(self.changed.wait(), min(wait, MAX_WAIT))
+            except asyncio.TimeoutError:
+                pass
+        return self.best
+
+
+def main():
+    service = RouteService()
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,187 +1,65 @@
-import networkx as nx
-import json
-import heapq
-import copy
-import re
-import random
+import argparse
+from graph_builder import build_graph, lazy_graph, source_graph
+from coverage_search import a_star, frontier_limit, SearchOptions
+from heuristics import build_heuristic
+from travel_times import tables_file
+from instrument import SearchMetrics, profiled
+from progress import ProgressPublisher, AtomicFileSink, JsonlSink, SocketSink
 
 SUPPRESS = False
 TEST_DATA = False
 DAYS = "12345"
 SOURCE = True
 SIMPLIFY = True
+LAZY_GRAPH = False # generate the graph while searching instead of building the whole day first
 EVERY_STOP = False
 OUTPUT_BEST_PATH = True
-
-STOP_TIME = 2
-
-STATION_MULTIPLIER = 1
-PATH_MULTIPLIER = 0.5
-TIME_MULTIPLIER = 0.25
-
-TRAIN = 0
-TRANSFER = 1
-
-def json_to_graph(graph_data):
-    """
-    Convert a JSON graph representation back to a NetworkX graph.
-    
-    Args:
-        graph_data (dict): Dictionary containing nodes and edges data
-        
-    Returns:
-        nx.Graph: A NetworkX graph reconstructed from the JSON data
-    """
-    G = nx.DiGraph()
-    
-    # Add nodes with attributes
-    for node_data in graph_data["nodes"]:
-        G.add_node(
-            node_data["id"],
-            label=node_data.get("label", ""),
-            time=node_data.get("time", 0)
-        )
-    
-    # Add edges with attributes
-    for edge_data in graph_data["edges"]:
-        G.add_edge(
-            edge_data["source"],
-            edge_data["target"],
-            type=edge_data.get("type", 0),
-            time=edge_data.get("time", 0)
-        )
-    
-    return G
-
-with open(f"working/metro_graph{'_test' if TEST_DATA else ''}{'_suppressed' if SUPPRESS else ''}{'_simplified' if SIMPLIFY else ''}.json", "r") as f:
-    graph_data = json.load(f)
-
-with open(f"working/{DAYS}.json", 'r') as f:
-    raw_data = json.load(f)
-
-with open("working/transfer_time.json", 'r') as f:
-    transfer_time = json.load(f)
-
-stations_index = {}
-current_index = 0
-for line in raw_data:
-    for station in raw_data[line]["stations"]:
-        if station in stations_index: continue
-        if line in transfer_time and station in transfer_time[line]:
-            dest_ids = set()
-            for dest_station in transfer_time[line][station]:
-                dest_id = dest_station.split("_")[2]
-                if dest_id not in dest_ids:
-                    dest_ids.add(dest_id)
-            
-            for dest_id in dest_ids:
-                if dest_id in stations_index:
-                    stations_index[station] = stations_index[dest_id]
-                    break
-        if station not in stations_index:
-            stations_index[station] = current_index
-            current_index += 1
-
-STATION_NUM = current_index
-
-def generate_source(G: nx.DiGraph):
-    START_TIME_MULTIPLIER = 0.000001
-
-    global STATION_NUM
-    global stations_index
-    source = "source"
-    source_node = "S_a_source_000"
-    G.add_node(source_node)
-    stations_index[source] = STATION_NUM
-    STATION_NUM = STATION_NUM + 1
-
-    # find all nodes without in-edges with type TRAIN
-    for node in G.nodes():
-        type_train = False
-        for pred in G.predecessors(node):
-            if G[pred][node]["type"] == TRAIN: 
-                type_train = True
-                break
-        if not type_train:
-            G.add_edge(source_node, node)
-            raw_time = int(node.split("_")[3])
-            G[source_node][node]["type"] = TRANSFER
-            G[source_node][node]["time"] = (raw_time - 6*60) * START_TIME_MULTIPLIER
-    return source_node
-
-G = json_to_graph(graph_data)
-    
-def a_star(G: nx.DiGraph, source):
-    q = []
-    
-    history = [False] * STATION_NUM
-    history[stations_index[source.split("_")[2]]] = True
-    traversed = 0
-    path = [source]
-    total_time = 0
-
-    heapq.heappush(q, (0, [source, total_time, copy.deepcopy(history), copy.deepcopy(path), copy.deepcopy(traversed)]))
-
-    current_best = 0
-    best_path = []
-    score_cache = set()
-    while len(q) > 0:
-        tup = heapq.heappop(q)
-        node, total_time, history, path, traversed = tup[1]
-        if not OUTPUT_BEST_PATH:
-            if random.random() < 0.001:
-                with open("working/best_path.json", "w") as f:
-                    f.write(json.dumps(path, indent=4))
-        if sum(history) > current_best:
-            current_best = sum(history)
-            best_path = path
-            if OUTPUT_BEST_PATH:
-                with open("working/best_path.json", "w") as f:
-                    f.write(json.dumps(path, indent=4))
-        # print(f"[{str(sum(history))}] " + '->'.join([n.split('_')[2] for n in path]) + ": " + str(tup[0]))
-        if sum(history) == STATION_NUM: 
-            print("===== FINISHED =====")
-            best_path = path
-            with open("working/best_path.json", "w") as f:
-                f.write(json.dumps(path, indent=4))
-            break
-        for successor in G.successors(node):
-            if successor in path: continue
-            new_time = total_time + G[node][successor]["time"]
-            new_station_index = stations_index[successor.split("_")[2]]
-            new_history = copy.deepcopy(history)
-            if EVERY_STOP:
-                if history[new_station_index] == False:
-                    station_index = stations_index[node.split("_")[2]]
-                    if station_index == new_station_index and G[node][successor]["time"] > STOP_TIME:
-                        new_history[new_station_index] = True
-            else:
-                new_history[new_station_index] = True
-            new_path = copy.deepcopy(path)
-            new_path.append(successor)
-
-            delta_stations = 0
-
-            if SUPPRESS:
-                if history[new_station_index] == False:
-                    line, number = re.match(r"([A-Za-z]{1,2})(\d{2})", node.split("_")[2]).groups()
-                    new_line, new_number = re.match(r"([A-Za-z]{1,2})(\d{2})", successor.split("_")[2]).groups()
-                    if line == new_line:
-                        if (node.split("_")[2] == "O54" and successor.split("_")[2] == "O12") or (node.split("_")[2] == "O12" and successor.split("_")[2] == "O54"):
-                            delta_stations = 5
-                        else:
-                            delta_stations = abs(int(number) - int(new_number))
-            else:
-                if history[new_station_index] == False:
-                    delta_stations = 1
-
-            new_traversed = traversed + delta_stations
-            score = new_time * TIME_MULTIPLIER + (STATION_NUM - new_traversed) * STATION_MULTIPLIER + len(new_path) * PATH_MULTIPLIER
-            # score = new_time * TIME_MULTIPLIER * (STATION_NUM - new_traversed) * STATION_MULTIPLIER + len(new_path) * PATH_MULTIPLIER
-            
-            if (successor, score) in score_cache: continue
-            heapq.heappush(q, (score, [successor, new_time, new_history, new_path, new_traversed]))
-            score_cache.add((successor, score))
-    print(best_path)
-
-a_star(G, generate_source(G) if SOURCE else "R_b_R28_480")
\ No newline at end of file
+HEURISTIC = None # admissible lower bound from heuristics.HEURISTICS, None keeps the weighted score
+UPPER_BOUND = None # with HEURISTIC, only look for routes of at most this many minutes
+MAX_FRONTIER = None # hard limit on frontier states, e.g. 2000000
+MAX_FRONTIER_BYTES = None # or on their approximate memory, e.g. 512 << 20
+BEAM_WIDTH = None # beam search: keep the best this many states of every coverage level
+ANYTIME_WEIGHT = None # with HEURISTIC, anytime weighted A* starting at this weight, e.g. 3.0
+PROFILE_PREFIX = "working/search_profile" # --profile writes .prof, .txt and .metrics.jsonl files here
+PROGRESS_JSONL = None # e.g. "working/progress.jsonl" to keep every improvement as an event stream
+PROGRESS_PORT = None # local UDP port to publish progress events to
+
+
+def main(metrics=None):
+    built = (lazy_graph if LAZY_GRAPH else build_graph)(DAYS, simplify=SIMPLIFY, suppress=SUPPRESS, test_data=TEST_DATA)
+
+    if SOURCE:
+        # link a super-source to all nodes without in-edges with type TRAIN
+        G, source_node, stations_index = source_graph(built)
+    else:
+        G, stations_index = built.graph, built.stations_index
+        source_node = G.node_id("R_b_R28_480")
+    heuristic = build_heuristic(HEURISTIC, built.raw_data, built.transfer_time, stations_index,
+                                tables=tables_file(DAYS)) if HEURISTIC else None
+    sinks = [AtomicFileSink("working/best_path.json")]
+    if PROGRESS_JSONL:
+        sinks.append(JsonlSink(PROGRESS_JSONL))
+    if PROGRESS_PORT:
+        sinks.append(SocketSink(PROGRESS_PORT))
+    with ProgressPublisher(sinks, G.node_name) as progress:
+        a_star(G, source_node, stations_index, every_stop=EVERY_STOP, segments=built.segments, heuristic=heuristic,
+               options=SearchOptions(
+                   progress=progress, output_best_path=OUTPUT_BEST_PATH, upper_bound=UPPER_BOUND,
+                   max_frontier=frontier_limit(MAX_FRONTIER, MAX_FRONTIER_BYTES), beam_width=BEAM_WIDTH,
+                   weight=ANYTIME_WEIGHT or 1.0, anytime=ANYTIME_WEIGHT is not None, metrics=metrics))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coverage search over the whole network")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"run under cProfile and write search metrics to {PROFILE_PREFIX}.*")
+    parser.add_argument("--timers", action="store_true", help="time the search phases (adds some overhead)")
+    args = parser.parse_args()
+    metrics = None
+    if args.profile or args.timers:
+        metrics = SearchMetrics(f"{PROFILE_PREFIX}.metrics.jsonl" if args.profile else None, timers=args.timers)
+    if args.profile:
+        with profiled(PROFILE_PREFIX):
+            main(metrics)
+    else:
+        main(metrics)
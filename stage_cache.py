@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+
+CACHE_DIR = "working/cache"
+CACHE_MAX_BYTES = 256 << 20
+CACHE_VERSION = 2 # bump when a stage changes what it writes
+
+
+def file_digest(filename):
+    """SHA-256 of the content of ``filename``."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stage_key(stage, inputs, options):
+    """
+    Content address of a stage output.
+
+    Args:
+        stage (str): stage name
+        inputs (list): digests of the input files, or keys of upstream stages
+        options (dict): JSON-serialisable flags the stage depends on
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{stage}:{CACHE_VERSION}".encode("utf-8"))
+    for value in inputs:
+        digest.update(value.encode("utf-8"))
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+class StageCache:
+    """
+    Content-addressed store of pipeline stage outputs, ``{directory}/{stage}-{key}{suffix}``.
+
+    An output is only ever written under the key of its inputs, so a hit is
+    always valid. Hits refresh the file's mtime, and after every write the
+    least recently used files are deleted until the directory fits in
+    ``max_bytes``.
+
+    Args:
+        directory (str): cache directory, created on first write
+        max_bytes (int): size budget of the directory
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.log = [] # (stage, key, hit, seconds) of every fetch
+        self.used = set()
+
+    def path(self, stage, key, suffix):
+        return os.path.join(self.directory, f"{stage}-{key}{suffix}")
+
+    def fetch(self, stage, key, suffix, produce):
+        """
+        Return the path of the output of ``stage`` for ``key``, running ``produce(path)`` on a miss.
+
+        ``produce`` writes to a temporary name that is renamed into place,
+        so concurrent runs never read a partial output.
+        """
+        start = time.perf_counter()
+        path = self.path(stage, key, suffix)
+        hit = os.path.exists(path)
+        if hit:
+            os.utime(path)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            produce(temp)
+            os.replace(temp, path)
+        self.used.add(path)
+        self.log.append((stage, key, hit, time.perf_counter() - start))
+        if not hit:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used outputs until the cache fits; outputs used by this run are kept."""
+        entries = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(".tmp"): continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if path in self.used: continue
+            os.remove(path)
+            total -= size
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from metro_graph import load_snapshot
+from graph_builder import build_graph, source_graph
+from coverage_search import a_star, path_summary, SearchOptions
+from heuristics import build_heuristic
+from progress import AtomicFileSink, write_json_atomic
+
+SUPPRESS = False
+TEST_DATA = False
+DAYS = "12345"
+SIMPLIFY = True
+EVERY_STOP = False
+HEURISTIC = None # admissible lower bound from heuristics.HEURISTICS, None keeps the weighted score
+
+SWEEP_START = 6*60
+SWEEP_END = 24*60
+SWEEP_WINDOW = 10 # minutes of trip starts per independent search
+MAX_EXPANSIONS = 200000 # per window
+WORKERS = None # defaults to os.cpu_count()
+
+# per-process search context, filled by init_worker
+_worker = {}
+
+
+def start_windows(start, end, window):
+    """Split ``[start, end)`` into consecutive start-time windows of ``window`` minutes."""
+    return [(t, min(t + window, end)) for t in range(start, end, window)]
+
+
+def init_worker(built, options):
+    """Map the shared graph snapshot and prepare the search once per worker process."""
+    built = built._replace(graph=load_snapshot(built.snapshot))
+    _worker["built"] = built
+    _worker["options"] = options
+    _worker["heuristic"] = None
+    if options["heuristic"]:
+        _, _, stations_index = source_graph(built)
+        _worker["heuristic"] = build_heuristic(options["heuristic"], built.raw_data, built.transfer_time,
+                                               stations_index)
+
+
+def solve_window(window):
+    """Search from a super-source linked only to the trips starting in ``window``."""
+    start, end = window
+    options = _worker["options"]
+    G, source, stations_index = source_graph(_worker["built"], start, end)
+    path = a_star(G, source, stations_index, every_stop=options["every_stop"],
+                  segments=_worker["built"].segments,
+                  heuristic=_worker["heuristic"], options=SearchOptions(max_expansions=options["max_expansions"]))
+    coverage, minutes = path_summary(G, path, stations_index)
+    return {
+        "start": start,
+        "end": end,
+        "coverage": coverage,
+        "minutes": minutes,
+        "path": [G.node_name(n) for n in path]
+    }
+
+
+def sweep(built, windows, options, workers=None):
+    """
+    Solve every start-time window in a process pool.
+
+    Every worker memory-maps the snapshot of ``built`` instead of receiving
+    the graph, so it is shared through the page cache rather than copied
+    into each process.
+
+    Returns:
+        list: one result dict per window, in window order
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(built._replace(graph=None), options)) as pool:
+        return list(pool.map(solve_window, windows))
+
+
+def best_result(results):
+    """Highest coverage first, then the shortest run."""
+    return max(results, key=lambda result: (result["coverage"], -result["minutes"]))
+
+
+def main():
+    built = build_graph(DAYS, simplify=SIMPLIFY, suppress=SUPPRESS, test_data=TEST_DATA)
+    options = {
+        "every_stop": EVERY_STOP,
+        "heuristic": HEURISTIC,
+        "max_expansions": MAX_EXPANSIONS
+    }
+    windows = start_windows(SWEEP_START, SWEEP_END, SWEEP_WINDOW)
+    print(f"Sweeping {len(windows)} start windows on {WORKERS or os.cpu_count()} workers")
+
+    results = sweep(built, windows, options, WORKERS)
+    for result in results:
+        print(f"{result['start'] // 60:02d}:{result['start'] % 60:02d} "
+              f"coverage {result['coverage']}, {result['minutes']} min")
+
+    best = best_result(results)
+    print(f"Best start {best['start'] // 60:02d}:{best['start'] % 60:02d}: "
+          f"coverage {best['coverage']} in {best['minutes']} min")
+    # visualization.PathWatcher may be reading best_path.json right now
+    sink = AtomicFileSink("working/best_path.json")
+    sink.write({"event": "finished", "path": best["path"]})
+    sink.close()
+    write_json_atomic("working/sweep_results.json", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import numpy as np
+from merge_raw_data import SERVICE_DAY_START
+from metro_graph import SOURCE_LINE
+
+OUTPUT_DIR = "working/synthetic"
+DAYS = "12345" # day label of the written files, so merge_raw_data and build_graph pick them up
+SEED = 0
+SCALE = 1 # multiplies LINES; 10 and 100 approximate 10x and 100x Taipei
+
+# a Taipei-sized network at scale 1
+LINES = 6
+STATIONS = (18, 28) # stations per line, drawn uniformly
+HOP_MINUTES = (1, 3) # ride between consecutive stations, drawn per hop
+PEAK_HEADWAY = 3
+OFFPEAK_HEADWAY = 6
+PEAK_HOURS = ((7*60, 9*60), (17*60, 19*60))
+SERVICE_START = 6*60 # first departure from a terminal
+SERVICE_END = 24*60 # last departure from a terminal
+SHORT_TURNS = 0.15 # share of trains that only run part of the line
+TRANSFER_DENSITY = 4 # interchanges per line, on average
+TRANSFER_MINUTES = (0, 5) # walking time of an interchange, drawn per interchange and direction
+RESERVED_LINES = {SOURCE_LINE.rsplit("_", 1)[0]} # line codes the graph uses for its own nodes
+
+
+def letters(index):
+    """Spreadsheet-style letters of ``index``: A, B, ..., Z, AA, AB, ..."""
+    name = ""
+    index += 1
+    while index:
+        index, letter = divmod(index - 1, 26)
+        name = chr(ord("A") + letter) + name
+    return name
+
+
+def line_name(index):
+    """
+    Letters-only name of line ``index`` (line codes must not contain digits or underscores).
+
+    Names in ``RESERVED_LINES`` are skipped, so the 19th line is T rather than S.
+    """
+    position = -1
+    while index >= 0:
+        position += 1
+        if letters(position) not in RESERVED_LINES:
+            index -= 1
+    return letters(position)
+
+
+def network(lines, rng, stations=STATIONS, hop_minutes=HOP_MINUTES):
+    """
+    Draw the lines of a network.
+
+    Returns:
+        list: ``(name, station codes, hop minutes)`` per line, in the ``_a`` direction
+    """
+    result = []
+    for index in range(lines):
+        name = line_name(index)
+        count = int(rng.integers(stations[0], stations[1] + 1))
+        width = max(2, len(str(count)))
+        codes = [f"{name}{number:0{width}d}" for number in range(1, count + 1)]
+        hops = rng.integers(hop_minutes[0], hop_minutes[1] + 1, size=count - 1)
+        result.append((name, codes, hops))
+    return result
+
+
+def interchanges(lines, rng, density=TRANSFER_DENSITY):
+    """
+    Pick the interchange stations of a network.
+
+    Every line after the first crosses a random earlier line, which keeps
+    the network connected; further random line pairs cross until there are
+    about ``density`` interchanges per line. Lines prefer to cross at a
+    station that is not an interchange yet.
+
+    Returns:
+        list: ``((line, station), (line, station))`` pairs, by line index
+    """
+    count = len(lines)
+    pairs = [(index, int(rng.integers(index))) for index in range(1, count)]
+    extra = max(0, round(count * density / 2) - len(pairs))
+    if count > 1:
+        first = rng.integers(count, size=extra)
+        second = (first + rng.integers(1, count, size=extra)) % count
+        pairs += list(zip(first.tolist(), second.tolist()))
+
+    used = [set() for _ in range(count)]
+
+    def station(line):
+        free = [i for i in range(len(lines[line][1])) if i not in used[line]]
+        index = int(rng.choice(free)) if free else int(rng.integers(len(lines[line][1])))
+        used[line].add(index)
+        return index
+
+    return [((a, station(a)), (b, station(b))) for a, b in pairs]
+
+
+def headway(minute, peak_headway=PEAK_HEADWAY, offpeak_headway=OFFPEAK_HEADWAY, peak_hours=PEAK_HOURS):
+    peak = any(start <= minute < end for start, end in peak_hours)
+    return peak_headway if peak else offpeak_headway
+
+
+def departures(rng, service_start=SERVICE_START, service_end=SERVICE_END, **headways):
+    """Terminal departure minutes of one direction, starting at a random phase of the first headway."""
+    minute = service_start + int(rng.integers(headway(service_start, **headways)))
+    result = []
+    while minute <= service_end:
+        result.append(minute)
+        minute += headway(minute, **headways)
+    return np.array(result, dtype=np.int64)
+
+
+def direction_times(hops, starts, rng, short_turns=SHORT_TURNS):
+    """
+    Trains x stations time matrix of one direction, -1 where a train does not stop.
+
+    Short-turn trains start or end at a random inner station. Trains that
+    would run past the end of the service day are dropped.
+    """
+    offsets = np.concatenate([[0], np.cumsum(hops)])
+    times = starts[:, None] + offsets[None, :]
+    stations = len(offsets)
+    if stations > 2:
+        short = np.flatnonzero(rng.random(len(starts)) < short_turns)
+        turn = rng.integers(1, stations - 1, size=len(short))
+        late = rng.random(len(short)) < 0.5
+        column = np.arange(stations)
+        for train, station, at_end in zip(short.tolist(), turn.tolist(), late.tolist()):
+            times[train, column > station if at_end else column < station] = -1
+    times = times[times.max(axis=1) < SERVICE_DAY_START + 24*60]
+    return times
+
+
+def write_schedule(filename, stations, times):
+    """Write one ``{stations, trainSchedules}`` file a train at a time, with null where a train does not stop."""
+    with open(filename, "w") as f:
+        f.write('{"stations": ' + json.dumps(stations) + ', "trainSchedules": [')
+        for row, train in enumerate(times.tolist()):
+            if row:
+                f.write(", ")
+            f.write("[" + ", ".join("null" if time < 0 else str(time) for time in train) + "]")
+        f.write("]}")
+
+
+def generate(directory=OUTPUT_DIR, scale=SCALE, lines=LINES, days=DAYS, seed=SEED, density=TRANSFER_DENSITY,
+             stations=STATIONS, hop_minutes=HOP_MINUTES, short_turns=SHORT_TURNS,
+             service_start=SERVICE_START, service_end=SERVICE_END, **headways):
+    """
+    Write a synthetic network to ``directory``.
+
+    Every line gets ``{line}_a_{days}_schedule.json`` and its reverse
+    ``{line}_b_{days}_schedule.json`` in the scraped format, written one
+    file at a time so large networks never sit in memory, plus the
+    ``transfer_time.json`` of its interchanges. The output merges and
+    builds like the real data: ``build_graph(days, data_dir=directory)``
+    after ``merge_raw_data``.
+
+    Args:
+        directory (str): output directory, created if missing
+        scale (int): multiplies ``lines``
+        lines (int): lines at scale 1
+        days (str): day label of the file names
+        seed (int): random seed; the same arguments write the same files
+        density (float): interchanges per line, on average
+        stations (tuple): range of stations per line
+        hop_minutes (tuple): range of the ride between two stations
+        short_turns (float): share of trains running only part of a line
+        service_start, service_end (int): first and last terminal departure
+        headways: ``peak_headway``, ``offpeak_headway`` and ``peak_hours`` overrides
+
+    Returns:
+        dict: line, station, train and interchange counts of the network
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    lines = network(lines * scale, rng, stations, hop_minutes)
+
+    trains = 0
+    for name, codes, hops in lines:
+        for direction, direction_codes, direction_hops in (("a", codes, hops), ("b", codes[::-1], hops[::-1])):
+            starts = departures(rng, service_start, service_end, **headways)
+            times = direction_times(direction_hops, starts, rng, short_turns)
+            write_schedule(os.path.join(directory, f"{name}_{direction}_{days}_schedule.json"), direction_codes,
+                           times)
+            trains += len(times)
+
+    transfer_time = {}
+    crossings = interchanges(lines, rng, density)
+    for (a, i), (b, j) in crossings:
+        for (line, index), (other, other_index) in (((a, i), (b, j)), ((b, j), (a, i))):
+            name, codes, _ = lines[line]
+            other_name, other_codes, _ = lines[other]
+            for direction in ("a", "b"):
+                entry = transfer_time.setdefault(f"{name}_{direction}", {}).setdefault(codes[index], {})
+                for other_direction in ("a", "b"):
+                    entry[f"{other_name}_{other_direction}_{other_codes[other_index]}"] = \
+                        int(rng.integers(TRANSFER_MINUTES[0], TRANSFER_MINUTES[1] + 1))
+    with open(os.path.join(directory, "transfer_time.json"), "w") as f:
+        json.dump(transfer_time, f, indent=4)
+
+    return {"lines": len(lines), "stations": sum(len(codes) for _, codes, _ in lines), "trains": trains,
+            "interchanges": len(crossings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic metro timetable in the scraped format")
+    parser.add_argument("--scale", type=int, default=SCALE, help=f"multiplies the {LINES} lines")
+    parser.add_argument("--lines", type=int, default=LINES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--density", type=float, default=TRANSFER_DENSITY, help="interchanges per line")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    args = parser.parse_args()
+    summary = generate(args.output, args.scale, args.lines, seed=args.seed, density=args.density)
+    print(f"Wrote {summary['lines']} lines, {summary['stations']} stations, {summary['trains']} trains and "
+          f"{summary['interchanges']} interchanges to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import bisect
+import heapq
+import time
+import numpy as np
+from merge_raw_data import NO_TIME
+from metro_graph import TRAIN, TRANSFER
+from journey import StopTable, Journey, INFINITY
+
+DAYS = "12345"
+ORIGIN = "R28"
+DESTINATION = "BL23"
+DEPARTURE = 8*60
+HEURISTIC = True # A* on ride-time lower bounds instead of plain Dijkstra
+
+
+def departure_function(departures, arrivals):
+    """
+    Reduce the trains of one hop to its "next departure -> arrival" function.
+
+    Keeps the trains no later departure arrives as early as, so both
+    returned lists are strictly increasing and the first departure at or
+    after a minute is also the earliest arrival.
+    """
+    kept = []
+    best = INFINITY
+    for departure, arrival in sorted(zip(departures, arrivals), key=lambda train: (-train[0], train[1])):
+        if arrival < best:
+            kept.append((departure, arrival))
+            best = arrival
+    kept.reverse()
+    return [departure for departure, _ in kept], [arrival for _, arrival in kept]
+
+
+class TimeDependentGraph(StopTable):
+    """
+    Time-dependent metro graph: one node per stop, edges carrying travel-time functions.
+
+    Stops are those of ``journey.StopTable``. A TRAIN edge joins consecutive served stations of a line and stores the
+    departures and arrivals of the trains making that hop as two sorted
+    arrays, pruned so the first departure at or after the current minute
+    gives the earliest arrival; a TRANSFER edge walks in a fixed time.
+    Evaluating an edge is one binary search, so the graph needs a few
+    hundred nodes instead of one per stop event. TRANSFER edges are the
+    table's ``transfers``, like the transfer edges of the time-expanded graph.
+
+    Edges are CSR arrays over stops (``succ_ptr``, ``succ``, ``succ_type``,
+    ``walk``); the function of TRAIN edge ``e`` is
+    ``dep_times[func_ptr[e]:func_ptr[e + 1]]`` with matching ``arr_times``.
+
+    Args:
+        schedules (dict): ``{line: Schedule}`` from ``merge_raw_data.load_merged``
+        transfer_time (dict): transfer walking times
+    """
+
+    def __init__(self, schedules, transfer_time):
+        super().__init__(schedules, transfer_time)
+
+        # (from, to) -> (departures, arrivals) of a TRAIN edge, or the minutes of a TRANSFER edge
+        edges = {}
+        for line, schedule in schedules.items():
+            stops = [self.stop_id[f"{line}_{station}"] for station in schedule.stations]
+            rows, columns = np.nonzero(schedule.times != NO_TIME)
+            hop = rows[1:] == rows[:-1]
+            start, end, rows = columns[:-1][hop], columns[1:][hop], rows[1:][hop]
+            departures, arrivals = schedule.times[rows, start], schedule.times[rows, end]
+            pairs = start * len(stops) + end
+            for pair in np.unique(pairs).tolist():
+                trains = pairs == pair
+                edges[(stops[pair // len(stops)], stops[pair % len(stops)])] = departure_function(
+                    departures[trains].tolist(), arrivals[trains].tolist())
+        for stop, other, minutes in self.transfers:
+            if other != stop:
+                edges[(stop, other)] = min(minutes, edges.get((stop, other), INFINITY))
+
+        keys = sorted(edges)
+        functions = [edges[key] if isinstance(edges[key], tuple) else ([], []) for key in keys]
+        self.succ_ptr = np.zeros(len(self.stop_line) + 1, dtype=np.int64)
+        np.cumsum(np.bincount([u for u, _ in keys], minlength=len(self.stop_line)), out=self.succ_ptr[1:])
+        self.succ = np.array([v for _, v in keys], dtype=np.int32)
+        self.succ_type = np.array([TRAIN if isinstance(edges[key], tuple) else TRANSFER for key in keys], dtype=np.uint8)
+        self.walk = np.array([0 if isinstance(edges[key], tuple) else edges[key] for key in keys], dtype=np.int16)
+        self.func_ptr = np.concatenate([[0], np.cumsum([len(departures) for departures, _ in functions])]).astype(np.int64)
+        self.dep_times = np.array([t for departures, _ in functions for t in departures], dtype=np.int16)
+        self.arr_times = np.array([t for _, arrivals in functions for t in arrivals], dtype=np.int16)
+
+        # plain lists: the search evaluates edges one element at a time
+        self._succ_ptr = self.succ_ptr.tolist()
+        self._succ = self.succ.tolist()
+        self._is_train = (self.succ_type == TRAIN).tolist()
+        self._walk = self.walk.tolist()
+        self._func_ptr = self.func_ptr.tolist()
+        self._dep_times = self.dep_times.tolist()
+        self._arr_times = self.arr_times.tolist()
+
+        # fastest ride of every edge, for the A* lower bounds
+        rides = (self.arr_times - self.dep_times).astype(np.int64)
+        fastest = np.where(self.succ_type == TRAIN, 0, self.walk).astype(np.int64)
+        trains = np.flatnonzero(self.succ_type == TRAIN)
+        if len(trains):
+            fastest[trains] = np.minimum.reduceat(rides, self.func_ptr[trains])
+        self._reverse = [[] for _ in self.stop_line]
+        tails = np.repeat(np.arange(len(self.stop_line)), np.diff(self.succ_ptr))
+        for u, v, minutes in zip(tails.tolist(), self._succ, fastest.tolist()):
+            self._reverse[v].append((u, minutes))
+        self._bounds = {}
+
+    def __len__(self):
+        return len(self.stop_line)
+
+    def number_of_nodes(self):
+        return len(self.stop_line)
+
+    def number_of_edges(self):
+        return len(self.succ)
+
+    def node_name(self, stop):
+        return f"{self.stop_line[stop]}_{self.stop_station[stop]}"
+
+    def evaluate(self, edge, minute):
+        """
+        Follow ``edge`` at ``minute``.
+
+        Returns:
+            tuple: ``(departure, arrival)``; ``(minute, INFINITY)`` when no train leaves any more
+        """
+        if not self._is_train[edge]:
+            return minute, minute + self._walk[edge]
+        lo, hi = self._func_ptr[edge], self._func_ptr[edge + 1]
+        k = bisect.bisect_left(self._dep_times, minute, lo, hi)
+        if k == hi:
+            return minute, INFINITY
+        return self._dep_times[k], self._arr_times[k]
+
+    def lower_bounds(self, destination):
+        """Fewest minutes from every stop to station ``destination`` over the fastest ride of every edge, memoised."""
+        if destination in self._bounds:
+            return self._bounds[destination]
+        reverse = self._reverse
+        bound = [INFINITY] * len(self.stop_line)
+        q = [(0, stop) for stop in self.station_stops[destination]]
+        for _, stop in q:
+            bound[stop] = 0
+        while q:
+            minutes, v = heapq.heappop(q)
+            if minutes > bound[v]: continue
+            for u, fastest in reverse[v]:
+                if minutes + fastest < bound[u]:
+                    bound[u] = minutes + fastest
+                    heapq.heappush(q, (minutes + fastest, u))
+        self._bounds[destination] = bound
+        return bound
+
+    def search(self, origin, departure, destination=None, heuristic=HEURISTIC):
+        """
+        Earliest arrival at every stop from station ``origin`` leaving at or after ``departure``.
+
+        Dijkstra on arrival minutes, evaluating each edge at the arrival at
+        its tail. With a ``destination`` the search stops once one of its
+        stops is settled, and with ``heuristic`` it is an A* search on
+        ``lower_bounds``, which are consistent because every edge takes at
+        least its fastest ride.
+
+        Returns:
+            tuple: ``(arrival, parent)`` per stop; ``parent[stop]`` is
+            ``(edge, departure)`` of the edge that reached it, or None
+        """
+        arrival = [INFINITY] * len(self.stop_line)
+        parent = [None] * len(self.stop_line)
+        bound = self.lower_bounds(destination) if destination is not None and heuristic else None
+        targets = set(self.station_stops[destination]) if destination is not None else ()
+        succ_ptr, succ, evaluate = self._succ_ptr, self._succ, self.evaluate
+
+        q = []
+        for stop in self.station_stops[origin]:
+            arrival[stop] = departure
+            heapq.heappush(q, (departure + (bound[stop] if bound else 0), departure, stop))
+        while q:
+            _, minute, u = heapq.heappop(q)
+            if minute > arrival[u]: continue
+            if u in targets:
+                break
+            for edge in range(succ_ptr[u], succ_ptr[u + 1]):
+                v = succ[edge]
+                leave, arrive = evaluate(edge, minute)
+                if arrive < arrival[v]:
+                    arrival[v] = arrive
+                    parent[v] = (edge, leave)
+                    estimate = bound[v] if bound else 0
+                    if estimate < INFINITY:
+                        heapq.heappush(q, (arrive + estimate, arrive, v))
+        return arrival, parent
+
+    def itinerary(self, arrival, parent, stop):
+        """Rebuild the node IDs of the time-expanded graph, ``{line}_{station}_{time}``, of the rides ending at ``stop``."""
+        legs = []
+        while parent[stop] is not None:
+            edge, leave = parent[stop]
+            tail = bisect.bisect_right(self._succ_ptr, edge) - 1
+            if self._is_train[edge]:
+                legs.append((f"{self.node_name(tail)}_{leave}", f"{self.node_name(stop)}_{arrival[stop]}"))
+            stop = tail
+        path = []
+        for boarding, alighting in reversed(legs):
+            if not path or path[-1] != boarding:
+                path.append(boarding)
+            path.append(alighting)
+        return path
+
+    def query(self, origin, destination, departure, heuristic=HEURISTIC):
+        """
+        Earliest-arrival itinerary from station ``origin`` to station ``destination``.
+
+        Returns:
+            Journey: as ``journey.ConnectionScan.query``
+        """
+        arrival, parent = self.search(origin, departure, destination, heuristic)
+        stop = min(self.station_stops[destination], key=lambda stop: arrival[stop])
+        if arrival[stop] == INFINITY:
+            return Journey(None, [])
+        return Journey(arrival[stop], self.itinerary(arrival, parent, stop))
+
+
+def main():
+    start = time.perf_counter()
+    G = TimeDependentGraph.from_days(DAYS)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    arrival, path = G.query(ORIGIN, DESTINATION, DEPARTURE)
+    elapsed = time.perf_counter() - start
+    print(f"{G.number_of_nodes()} stops, {G.number_of_edges()} edges, {len(G.dep_times)} departures in {built:.2f}s")
+    if arrival is None:
+        print(f"No journey from {ORIGIN} to {DESTINATION} after {DEPARTURE // 60:02d}:{DEPARTURE % 60:02d}")
+        return
+    print(path)
+    print(f"{ORIGIN} -> {DESTINATION}: arrive {arrival // 60:02d}:{arrival % 60:02d} ({elapsed * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from journey import ConnectionScan, INFINITY
+from graph_builder import prepare_stage
+from coverage_search import build_stations_index
+from stage_cache import StageCache
+
+DAYS = "12345"
+BUCKET_START = 5*60
+BUCKET_END = 25*60
+BUCKET_WIDTH = 30 # minutes per time bucket
+MAX_TRAVEL = 4*60 # no shortest journey in the network takes longer
+WORKERS = None # defaults to os.cpu_count()
+CHECK = False # compare the bounds of every code of multi-code stations against ConnectionScan
+
+UNREACHABLE = np.iinfo(np.uint16).max
+
+# per-process planner, created by init_worker
+_worker = {}
+
+
+def tables_file(days=DAYS, data_dir="working"):
+    """Return the ``compute_tables`` filename (without extension) of the schedule ``days``."""
+    return os.path.join(data_dir, f"travel_times_{days}")
+
+
+def station_groups(stations_index):
+    """Return the station codes of every index of ``stations_index``, in index order."""
+    groups = [[] for _ in range(max(stations_index.values()) + 1)]
+    for station, index in stations_index.items():
+        groups[index].append(station)
+    return groups
+
+
+def init_worker(days, data_dir, groups):
+    _worker["planner"] = ConnectionScan.from_days(days, data_dir)
+    _worker["groups"] = groups
+
+
+def bucket_table(start):
+    """
+    Minutes from every station index to every other when leaving at ``start``.
+
+    Waiting for the first train counts as travel time. A station with
+    several codes scans from all of them at once, so its row holds the
+    fastest member and bounds every one. Entries that need longer than
+    ``MAX_TRAVEL`` are ``UNREACHABLE``.
+    """
+    planner, groups = _worker["planner"], _worker["groups"]
+    table = np.full((len(groups), len(groups)), UNREACHABLE, dtype=np.uint16)
+    for origin, stations in enumerate(groups):
+        stations = [station for station in stations if station in planner.station_stops]
+        if not stations: continue
+        arrival, _ = planner.scan(stations, start, until=start + MAX_TRAVEL)
+        for destination, dest_stations in enumerate(groups):
+            best = min((arrival[stop] for station in dest_stations for stop in planner.station_stops.get(station, ())),
+                       default=INFINITY)
+            if best - start <= MAX_TRAVEL:
+                table[origin, destination] = best - start
+    return table
+
+
+def compute_tables(filename, days=DAYS, data_dir="working", start=BUCKET_START, end=BUCKET_END,
+                   width=BUCKET_WIDTH, workers=None):
+    """
+    Fill the travel-time tables of every bucket in a process pool and save them.
+
+    Writes ``{filename}.npy``, a buckets x stations x stations uint16 array,
+    and ``{filename}.json`` with the bucket layout and the stations index.
+    """
+    _, prepared = prepare_stage(days, data_dir=data_dir)
+    raw_data, transfer_time, _ = prepared(StageCache())
+    stations_index = build_stations_index(raw_data, transfer_time)
+    groups = station_groups(stations_index)
+    starts = list(range(start, end, width))
+
+    tables = np.lib.format.open_memmap(f"{filename}.npy", mode="w+", dtype=np.uint16,
+                                       shape=(len(starts), len(groups), len(groups)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(days, data_dir, groups)) as pool:
+        for bucket, table in enumerate(pool.map(bucket_table, starts)):
+            tables[bucket] = table
+    tables.flush()
+    with open(f"{filename}.json", "w") as f:
+        json.dump({"start": start, "width": width, "stations_index": stations_index}, f)
+
+
+class TravelTimes:
+    """
+    Memory-mapped travel-time tables written by ``compute_tables``.
+
+    Lookups are two array indexings; the tables are only paged in as they
+    are used, so every process can open them cheaply. The solvers use them
+    through the ``"travel_times"`` heuristic of ``heuristics``.
+    """
+
+    def __init__(self, filename):
+        self.tables = np.load(f"{filename}.npy", mmap_mode="r")
+        with open(f"{filename}.json", "r") as f:
+            layout = json.load(f)
+        self.start = layout["start"]
+        self.width = layout["width"]
+        self.stations_index = layout["stations_index"]
+
+    def bucket(self, minute):
+        return min(max((minute - self.start) // self.width, 0), len(self.tables) - 1)
+
+    def minutes(self, origin, destination, minute):
+        """Travel time from station index ``origin`` to ``destination`` leaving at the start of ``minute``'s bucket."""
+        value = self.tables[self.bucket(minute), origin, destination]
+        return INFINITY if value == UNREACHABLE else int(value)
+
+    def lower_bound(self, origin, destination, minute):
+        """
+        Travel time from ``origin`` to ``destination`` leaving at ``minute`` or later, never overestimated.
+
+        Leaving later never arrives earlier, so the arrival from the start
+        of the bucket bounds every departure inside it.
+        """
+        bucket = self.bucket(minute)
+        value = self.tables[bucket, origin, destination]
+        if value == UNREACHABLE or minute < self.start:
+            return 0
+        return max(int(value) - (minute - self.start - bucket * self.width), 0)
+
+
+def check_bounds(filename, days=DAYS, data_dir="working", minutes=None):
+    """
+    Check ``TravelTimes.lower_bound`` against ConnectionScan from every code of every multi-code station.
+
+    Args:
+        minutes (list): departure minutes to check; defaults to every bucket start and the minute after it
+
+    Returns:
+        list: ``(origin, destination, minute, bound, travel)`` of the overestimates
+    """
+    tables = TravelTimes(filename)
+    planner = ConnectionScan.from_days(days, data_dir)
+    groups = station_groups(tables.stations_index)
+    if minutes is None:
+        starts = [tables.start + bucket * tables.width for bucket in range(len(tables.tables))]
+        minutes = starts + [minute + 1 for minute in starts]
+    overestimates = []
+    checks = 0
+    for origin, stations in enumerate(groups):
+        if len(stations) < 2: continue
+        for station in stations:
+            if station not in planner.station_stops: continue
+            for minute in minutes:
+                arrival, _ = planner.scan(station, minute, until=minute + MAX_TRAVEL)
+                for destination, dest_stations in enumerate(groups):
+                    best = min((arrival[stop] for code in dest_stations for stop in planner.station_stops.get(code, ())),
+                               default=INFINITY)
+                    if best == INFINITY: continue
+                    bound = tables.lower_bound(origin, destination, minute)
+                    checks += 1
+                    if bound > best - minute:
+                        overestimates.append((station, dest_stations[0], minute, bound, best - minute))
+    print(f"Checked {checks} bounds from multi-code stations: {len(overestimates)} overestimates")
+    return overestimates
+
+
+def main():
+    filename = tables_file(DAYS)
+    start = time.perf_counter()
+    compute_tables(filename, DAYS, workers=WORKERS)
+    tables = TravelTimes(filename)
+    reachable = tables.tables != UNREACHABLE
+    print(f"Saved {filename}.npy: {tables.tables.shape[0]} buckets of {tables.tables.shape[1]} stations "
+          f"({reachable.mean():.1%} reachable) in {time.perf_counter() - start:.1f}s on {WORKERS or os.cpu_count()} workers")
+    if CHECK:
+        for station, destination, minute, bound, travel in check_bounds(filename, DAYS)[:10]:
+            print(f"  {station} -> {destination} at {minute // 60:02d}:{minute % 60:02d}: bound {bound} > {travel} minutes")
+
+
+if __name__ == "__main__":
+    main()
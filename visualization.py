@@ -2,6 +2,7 @@ import json
 import time
 import os
 import csv
+import hashlib
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import networkx as nx
@@ -9,6 +10,10 @@ import numpy as np
 from matplotlib.patches import Patch
 from matplotlib.lines import Line2D
 import re
+import urllib.request
+from merge_raw_data import load_raw_data
+
+SERVICE_URL = None # e.g. "http://127.0.0.1:8080" to follow server.py instead of working/best_path.json
 
 
 
@@ -141,122 +146,133 @@ def load_best_path():
         return []
 
 def load_metro_data():
-    """Load the metro data from the JSON file."""
+    """Load the merged 12345 schedule (working/12345.npz, or the legacy JSON)."""
     try:
-        with open('working/12345.json', 'r') as file:
-            return json.load(file)
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Error loading 12345.json: {e}")
+        return load_raw_data("12345")
+    except (json.JSONDecodeError, FileNotFoundError, ValueError) as e:
+        print(f"Error loading the 12345 schedule: {e}")
         return {}
 
-def update_visualization(frame, ax, stations, pos, path_info):
-    """Update the visualization with the current best path."""
-    ax.clear()
-    best_path = load_best_path()
-    
-    # Create NetworkX graph for visualization
+def draw_network(ax, stations, pos):
+    """Draw the static part of the map once: stations, line edges, transfer labels and legend."""
     G = nx.Graph()
-    
+
     # Add all stations as nodes
     for station_key, info in stations.items():
         G.add_node(station_key, line=info['line'], station=info['station'])
-    
+
     # Draw the network with line colors
     for line, color in LINE_COLORS.items():
         line_nodes = [n for n in G.nodes() if G.nodes[n]['line'] == line]
-        nx.draw_networkx_nodes(G, pos, nodelist=line_nodes, node_color=color, 
+        nx.draw_networkx_nodes(G, pos, nodelist=line_nodes, node_color=color,
                               node_size=50, alpha=0.8, ax=ax)
-        
-    # Draw edges for each line with matching colors
-    for line, color in LINE_COLORS.items():
-        line_edges = []
-        line_stations = sorted([n for n in G.nodes() if G.nodes[n]['line'] == line],
-                              key=lambda x: int(re.search(r'\d+', x.split("_")[1]).group()))
-        
-        for i in range(len(line_stations) - 1):
-            if (line_stations[i], line_stations[i+1]) in G.edges():
-                line_edges.append((line_stations[i], line_stations[i+1]))
-        
-        nx.draw_networkx_edges(G, pos, edgelist=line_edges, width=1.5, alpha=0.7,
-                              edge_color=color, ax=ax)
-    
+
     # Label the stations - only show labels for transfer stations to avoid clutter
-    locations = load_station_locations()
     station_counts = {}
     for node in G.nodes():
         station_code = G.nodes[node]['station']
-        if station_code not in station_counts:
-            station_counts[station_code] = 0
-        station_counts[station_code] += 1
-    
+        station_counts[station_code] = station_counts.get(station_code, 0) + 1
+
     # Only label transfer stations (stations that appear in multiple lines)
-    transfer_stations = {node: G.nodes[node]['station'] for node in G.nodes() 
+    transfer_stations = {node: G.nodes[node]['station'] for node in G.nodes()
                          if station_counts.get(G.nodes[node]['station'], 0) > 1}
-    
-    nx.draw_networkx_labels(G, pos, labels=transfer_stations, font_size=6, font_color="black", 
+
+    nx.draw_networkx_labels(G, pos, labels=transfer_stations, font_size=6, font_color="black",
                            font_weight='bold', ax=ax)
-    
-    # Process and highlight the best path
-    if best_path:
-        # Extract station keys from the path for highlighting
-        path_stations = []
-        
-        for i, node_id in enumerate(best_path):
-            # Skip S_source nodes (fake stations)
-            if node_id.startswith("S_a_source") or node_id.startswith("S_b_source"):
-                continue
-                
-            parts = node_id.split("_")
-            if len(parts) >= 3:
-                line = parts[0]
-                station = parts[2]
-                station_key = f"{line}_{station}"
-                path_stations.append(station_key)
-        
-        # Draw the highlighted path nodes
-        highlighted_nodes = list(set(path_stations))
-        nx.draw_networkx_nodes(G, pos, nodelist=highlighted_nodes, node_color='red', 
-                              node_size=80, alpha=1.0, ax=ax)
-        
-        # Draw path lines for direction rather than arrows (better for geographic display)
-        path_edges = []
-        for i in range(len(path_stations) - 1):
-            # Skip if either station doesn't have a position
-            if path_stations[i] not in pos or path_stations[i+1] not in pos:
-                continue
-            
-            path_edges.append((path_stations[i], path_stations[i+1]))
-        
-        # Draw path edges as red lines
-        nx.draw_networkx_edges(G, pos, edgelist=path_edges, width=2.5, alpha=1.0,
-                              edge_color='red', style='dashed', ax=ax)
-        
-        # Add path information
-        path_text = []
-        displayed_index = 1
-        for i, node_id in enumerate(best_path):
-            # Skip source nodes
-            if node_id.startswith("S_a_source") or node_id.startswith("S_b_source"):
-                continue
-                
-            line, direction, station, time = extract_station_info(node_id)
-            if line and station and time:
-                path_text.append(f"{displayed_index}. {line}_{station} - {time}")
-                displayed_index += 1
-        
-        path_info.set_text("\n".join(path_text[:20]) + "\n..." if len(path_text) > 20 else "\n".join(path_text))
-    
+
     # Add legend
-    legend_elements = [Patch(facecolor=color, edgecolor='w', label=line) 
+    legend_elements = [Patch(facecolor=color, edgecolor='w', label=line)
                       for line, color in LINE_COLORS.items()]
-    legend_elements.append(Line2D([0], [0], marker='o', color='w', markerfacecolor='red', 
+    legend_elements.append(Line2D([0], [0], marker='o', color='w', markerfacecolor='red',
                                  markersize=10, label='Path'))
-    
+
     ax.legend(handles=legend_elements, loc='upper left', bbox_to_anchor=(1, 1))
     ax.set_title('Taipei Metro Network - Best Path Visualization')
     ax.axis('off')
-    
-    return ax,
+
+class PathWatcher:
+    """Return the watched best path only when the file actually changed (mtime, then content hash)."""
+
+    def __init__(self, filename='working/best_path.json'):
+        self.filename = filename
+        self.mtime = None
+        self.digest = None
+
+    def poll(self):
+        """Return the new path, or None if the file is unchanged or unreadable."""
+        try:
+            mtime = os.stat(self.filename).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime == self.mtime:
+            return None
+
+        with open(self.filename, 'rb') as file:
+            content = file.read()
+        digest = hashlib.md5(content).digest()
+        if digest == self.digest:
+            self.mtime = mtime
+            return None
+        try:
+            path = json.loads(content)
+        except json.JSONDecodeError:
+            # half-written by an older solver; try again next frame
+            return None
+
+        self.mtime = mtime
+        self.digest = digest
+        return path
+
+class ServiceWatcher:
+    """Return the best path published by server.py only when its version changed."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.version = 0
+
+    def poll(self):
+        """Return the new path, or None if it is unchanged or the service is unreachable."""
+        try:
+            with urllib.request.urlopen(f"{self.url}/best?since={self.version}", timeout=1) as response:
+                best = json.load(response)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if best['version'] == self.version:
+            return None
+        self.version = best['version']
+        return best['path']
+
+def path_overlay_data(best_path, pos):
+    """Return the path coordinates, highlighted station coordinates and text box lines."""
+    # Extract station keys from the path for highlighting, skipping S_source nodes (fake stations)
+    path_stations = []
+    path_text = []
+    for node_id in best_path:
+        if node_id.startswith("S_a_source") or node_id.startswith("S_b_source"):
+            continue
+
+        line, direction, station, time = extract_station_info(node_id)
+        if line and station:
+            path_stations.append(f"{line}_{station}")
+            path_text.append(f"{len(path_text) + 1}. {line}_{station} - {time}")
+
+    # break the dashed line where a station has no position
+    xy = np.array([pos[key] if key in pos else (np.nan, np.nan) for key in path_stations], dtype=float).reshape(-1, 2)
+    highlighted = np.array([pos[key] for key in set(path_stations) if key in pos], dtype=float).reshape(-1, 2)
+
+    text = "\n".join(path_text[:20]) + "\n..." if len(path_text) > 20 else "\n".join(path_text)
+    return xy, highlighted, text
+
+def update_visualization(frame, watcher, pos, path_line, path_nodes, path_info):
+    """Update the path overlay when the watched best path changed; the map itself is never redrawn."""
+    best_path = watcher.poll()
+    if best_path is not None:
+        xy, highlighted, text = path_overlay_data(best_path, pos)
+        path_line.set_data(xy[:, 0], xy[:, 1])
+        path_nodes.set_offsets(highlighted)
+        path_info.set_text(text)
+
+    return path_line, path_nodes, path_info
 
 def main():
     # Load the metro data
@@ -274,19 +290,28 @@ def main():
     
     # Set up the plot with an appropriate aspect ratio for the map
     fig, ax = plt.subplots(figsize=(12, 14))
-    
-    # Text box for path information
-    path_info = ax.text(1.05, 0.5, '', transform=ax.transAxes, 
-                       verticalalignment='center', bbox=dict(facecolor='white', alpha=0.8))
+    plt.subplots_adjust(left=0.05, right=0.8, top=0.95, bottom=0.05)
+    draw_network(ax, stations, pos)
+
+    # Path overlay, drawn above the static map and updated in place
+    path_line, = ax.plot([], [], color='red', linestyle='--', linewidth=2.5, zorder=3, animated=True)
+    path_nodes = ax.scatter([], [], s=80, c='red', zorder=4, animated=True)
+
+    # Text box for path information, in its own axes so that blitting covers it
+    info_ax = fig.add_axes([0.82, 0.05, 0.17, 0.75])
+    info_ax.axis('off')
+    path_info = info_ax.text(0, 0.5, '', transform=info_ax.transAxes, animated=True,
+                             verticalalignment='center', bbox=dict(facecolor='white', alpha=0.8))
     
     # Add a title
     plt.suptitle('Taipei Metro Network - Best Path Visualization (Geographic)', fontsize=16)
     
-    # Create animation that updates every 2 seconds
-    ani = animation.FuncAnimation(fig, update_visualization, fargs=(ax, stations, pos, path_info), 
-                                  interval=200, cache_frame_data=False)
+    # Poll every 200 ms (the file, or server.py's /best); only the overlay artists are redrawn (blitted)
+    watcher = ServiceWatcher(SERVICE_URL) if SERVICE_URL else PathWatcher()
+    ani = animation.FuncAnimation(fig, update_visualization,
+                                  fargs=(watcher, pos, path_line, path_nodes, path_info),
+                                  interval=200, blit=True, cache_frame_data=False)
     
-    plt.subplots_adjust(left=0.05, right=0.8, top=0.95, bottom=0.05)
     plt.show()
 
 if __name__ == "__main__":